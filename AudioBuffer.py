@@ -0,0 +1,174 @@
+import threading
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # resampling is optional
+    np = None
+
+
+class AudioRingBuffer:
+    """
+    Preallocated ring buffer of captured audio bytes. Writer (audio callback) copies into it without allocating, when
+    buffer is full the oldest audio is overwritten and counted as overrun - recognizer should rather get fresh speech
+    late than old speech.
+    Readers get chunks with get() and empty(), same as from queue.Queue, so it can be input of ibm_watson AudioSource.
+    """
+
+    def __init__(self, size: int, chunk: int, frame_size: int = 2):
+        """
+        :param size: capacity in bytes (rounded down to whole frames)
+        :param chunk: max bytes returned by one get()
+        :param frame_size: bytes of one frame (sample of every channel), audio is dropped in whole frames
+        """
+        self.frame_size = frame_size
+        self.chunk = chunk
+        self._cond = threading.Condition()
+        self._closed = False
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.bytes_dropped = 0
+        self.overruns = 0
+        self.__allocate(size)
+
+    def __allocate(self, size: int) -> None:
+        size -= size % self.frame_size
+        if size <= 0:
+            raise ValueError("Buffer has to hold at least one frame")
+        self.size = size
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._count = 0
+
+    def resize(self, size: int) -> None:
+        """
+        Change capacity, the newest audio that fits is kept
+        """
+        with self._cond:
+            data = self.__take(self._count)
+            self.__allocate(size)
+            self.__put(data)
+
+    def write(self, data: bytes) -> None:
+        with self._cond:
+            self.bytes_written += len(data)
+            self.__put(data)
+            self._cond.notify()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> bytes:
+        """
+        :return: up to self.chunk bytes, b'' if buffer was closed (or nothing came in time)
+        """
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: self._count or self._closed, timeout)
+            data = self.__take(min(self._count, self.chunk))
+            self.bytes_read += len(data)
+            return data
+
+    def empty(self) -> bool:
+        return not self._count
+
+    def close(self) -> None:
+        """
+        Wake readers, get() returns what's left and then b''
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self) -> None:
+        with self._cond:
+            self._start = 0
+            self._count = 0
+            self._closed = False
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {'written': self.bytes_written, 'read': self.bytes_read, 'dropped': self.bytes_dropped,
+                    'overruns': self.overruns, 'buffered': self._count, 'size': self.size}
+
+    def __put(self, data) -> None:
+        size = self.size
+        data = memoryview(data)
+        if len(data) > size:
+            # only the newest audio fits
+            skip = len(data) - size
+            skip += -skip % self.frame_size
+            self.bytes_dropped += skip
+            self.overruns += 1
+            data = data[skip:]
+        overflow = self._count + len(data) - size
+        if overflow > 0:
+            overflow += -overflow % self.frame_size
+            self._start = (self._start + overflow) % size
+            self._count -= overflow
+            self.bytes_dropped += overflow
+            self.overruns += 1
+
+        end = (self._start + self._count) % size
+        first = min(len(data), size - end)
+        self._view[end:end + first] = data[:first]
+        if first < len(data):
+            self._view[:len(data) - first] = data[first:]
+        self._count += len(data)
+
+    def __take(self, length: int) -> bytes:
+        start = self._start
+        first = min(length, self.size - start)
+        data = self._buffer[start:start + first]
+        if first < length:
+            data += self._buffer[:length - first]
+        self._start = (start + length) % self.size
+        self._count -= length
+        return bytes(data)
+
+
+class Resampler:
+    """
+    Vectorized downmix to mono and resample of 16 bit audio (e.g. 48 kHz stereo -> 16 kHz mono for recognizer).
+    Integer ratios average every `ratio` samples, others are linearly interpolated. State is kept between chunks, so
+    chunk length doesn't have to be a multiple of the ratio. Needs numpy.
+    """
+
+    def __init__(self, rate_in: int, channels: int = 1, rate_out: int = 16000):
+        if np is None:
+            raise ImportError("Resampling needs numpy")
+        self.rate_in = rate_in
+        self.channels = channels
+        self.rate_out = rate_out
+        self.ratio = rate_in / rate_out
+        self.integer_ratio = int(self.ratio) if self.ratio == int(self.ratio) else None
+        # samples of previous chunk not consumed yet
+        self.__rest = np.zeros(0, dtype=np.float32)
+        # position of the next output sample in input samples, relative to start of self.__rest
+        self.__position = 0.0
+
+    def process(self, data: bytes) -> bytes:
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[:len(samples) - len(samples) % self.channels]
+            samples = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            samples = samples.astype(np.float32)
+        if self.__rest.size:
+            samples = np.concatenate((self.__rest, samples))
+
+        if self.integer_ratio is not None:
+            usable = len(samples) - len(samples) % self.integer_ratio
+            out = samples[:usable].reshape(-1, self.integer_ratio).mean(axis=1)
+            self.__rest = samples[usable:]
+        else:
+            # interpolation needs the sample after every position
+            positions = np.arange(self.__position, len(samples) - 1, self.ratio)
+            out = np.interp(positions, np.arange(len(samples)), samples)
+            next_position = self.__position + len(positions) * self.ratio
+            consumed = min(int(next_position), len(samples))
+            self.__rest = samples[consumed:]
+            self.__position = next_position - consumed
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16).tobytes()
+
+    def reset(self) -> None:
+        self.__rest = np.zeros(0, dtype=np.float32)
+        self.__position = 0.0
@@ -0,0 +1,155 @@
+import heapq
+from dataclasses import dataclass, field, replace
+from itertools import count
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class Chord:
+    """
+    Keys held together, fires when the last of them is pressed
+    """
+    action_name: str
+    codes: Tuple[int, ...]
+    # bit per key code
+    mask: int
+
+
+@dataclass(frozen=True)
+class Sequence:
+    """
+    Keys pressed one after another, each within window seconds from previous one (double-tap is the same key twice).
+    Pressing any other key breaks the sequence.
+    """
+    action_name: str
+    codes: Tuple[int, ...]
+    window: float
+
+
+@dataclass(frozen=True)
+class LongPress:
+    """
+    Key held for at least duration seconds, fires once per press
+    """
+    action_name: str
+    code: int
+    duration: float
+
+
+@dataclass(frozen=True)
+class ComboTable:
+    """
+    Immutable combo bindings indexed by key code, so only bindings of changed key are checked:
+    chords by every key they contain, sequences by their first key, long presses by their key.
+    """
+    chords: Dict[int, Tuple[Chord, ...]] = field(default_factory=dict)
+    sequences: Dict[int, Tuple[Sequence, ...]] = field(default_factory=dict)
+    long_presses: Dict[int, Tuple[LongPress, ...]] = field(default_factory=dict)
+    # every key code used by any combo
+    codes: FrozenSet[int] = frozenset()
+
+    def with_chord(self, action_name: str, codes: Tuple[int, ...]) -> 'ComboTable':
+        mask = 0
+        for code in codes:
+            mask |= 1 << code
+        chord = Chord(action_name, tuple(codes), mask)
+        chords = dict(self.chords)
+        for code in set(codes):
+            if chord not in chords.get(code, ()):
+                chords[code] = chords.get(code, ()) + (chord,)
+        return replace(self, chords=chords, codes=self.codes | set(codes))
+
+    def with_sequence(self, action_name: str, codes: Tuple[int, ...], window: float) -> 'ComboTable':
+        sequence = Sequence(action_name, tuple(codes), window)
+        sequences = dict(self.sequences)
+        if sequence not in sequences.get(codes[0], ()):
+            sequences[codes[0]] = sequences.get(codes[0], ()) + (sequence,)
+        return replace(self, sequences=sequences, codes=self.codes | set(codes))
+
+    def with_long_press(self, action_name: str, code: int, duration: float) -> 'ComboTable':
+        long_press = LongPress(action_name, code, duration)
+        long_presses = dict(self.long_presses)
+        if long_press not in long_presses.get(code, ()):
+            long_presses[code] = long_presses.get(code, ()) + (long_press,)
+        return replace(self, long_presses=long_presses, codes=self.codes | {code})
+
+
+class ComboMatcher:
+    """
+    Runtime state of combo matching - sequences in progress and pending long presses.
+    Fed with key changes only (press/release), pressed keys are passed as bitset of key codes.
+    Current table is passed with every call - combos in progress that aren't bound in it anymore (e.g. after profile
+    switch) are dropped.
+    """
+
+    def __init__(self, push: Callable[[str, Optional[float]], None]):
+        """
+        :param push: called with action name and event time (None for long presses) when combo fires
+        """
+        self.push = push
+        # sequence -> (index of next expected key, deadline)
+        self.progress: Dict[Sequence, Tuple[int, float]] = {}
+        # key code -> press number, long presses of older presses are stale
+        self.held: Dict[int, int] = {}
+        # (deadline, press number, index of long press bound to key, long press)
+        self.__long_press_heap: List[Tuple[float, int, int, LongPress]] = []
+        self.__press_numbers = count()
+
+    def press(self, table: ComboTable, code: int, pressed_mask: int, now: float,
+              event_time: Optional[float] = None) -> None:
+        """
+        :param pressed_mask: bitset of pressed keys, including this one
+        :param now: time.monotonic of the press, sequence windows are measured with it
+        """
+        for chord in table.chords.get(code, ()):
+            if pressed_mask & chord.mask == chord.mask:
+                self.push(chord.action_name, event_time)
+
+        progress: Dict[Sequence, Tuple[int, float]] = {}
+        fired: Set[Sequence] = set()
+        for sequence, (index, deadline) in self.progress.items():
+            if sequence not in table.sequences.get(sequence.codes[0], ()):
+                continue
+            if sequence.codes[index] == code and now <= deadline:
+                if index + 1 == len(sequence.codes):
+                    fired.add(sequence)
+                    self.push(sequence.action_name, event_time)
+                else:
+                    progress[sequence] = (index + 1, now + sequence.window)
+        for sequence in table.sequences.get(code, ()):
+            # press completing a sequence doesn't start it again (no double-tap on third tap)
+            if sequence not in progress and sequence not in fired:
+                if len(sequence.codes) == 1:
+                    self.push(sequence.action_name, event_time)
+                else:
+                    progress[sequence] = (1, now + sequence.window)
+        self.progress = progress
+
+        long_presses = table.long_presses.get(code)
+        if long_presses is not None:
+            number = next(self.__press_numbers)
+            self.held[code] = number
+            for index, long_press in enumerate(long_presses):
+                heapq.heappush(self.__long_press_heap, (now + long_press.duration, number, index, long_press))
+
+    def release(self, code: int) -> None:
+        self.held.pop(code, None)
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Deadline (time.monotonic) of the next pending long press, None if there is none
+        """
+        heap = self.__long_press_heap
+        while heap and self.held.get(heap[0][3].code) != heap[0][1]:
+            # key was released (or pressed again) in the meantime
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][0]
+        return None
+
+    def push_due(self, table: ComboTable, now: float) -> None:
+        heap = self.__long_press_heap
+        while heap and heap[0][0] <= now:
+            deadline, number, index, long_press = heapq.heappop(heap)
+            if self.held.get(long_press.code) == number and long_press in table.long_presses.get(long_press.code, ()):
+                self.push(long_press.action_name, None)
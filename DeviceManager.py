@@ -0,0 +1,200 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+from fnmatch import fnmatch
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import evdev as ev
+
+# inotify(7) constants
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class DeviceManagerError(Exception):
+    def __init__(self, message='Problem with device manager!'):
+        super().__init__(message)
+
+
+class DeviceManager:
+    """
+    Keeps set of opened input devices in sync with device directory (/dev/input), watching it with inotify.
+    Devices are opened and closed incrementally, their capabilities are cached, so they are available even after
+    device is unplugged. Attach/detach callbacks let reader register and unregister devices without restarting.
+
+    Devices can be filtered by name and phys (shell-like patterns, e.g. "Xbox*") and by (vendor, product) ids.
+    """
+
+    def __init__(self, device_dir: str = "/dev/input", names: Optional[Iterable[str]] = None,
+                 phys: Optional[Iterable[str]] = None, ids: Optional[Iterable[Tuple[int, int]]] = None,
+                 opener: Callable[[str], ev.InputDevice] = ev.InputDevice):
+        """
+        :param device_dir: directory with event* device nodes (may be fake one, together with opener)
+        :param names: accepted device names patterns, None accepts all
+        :param phys: accepted device phys patterns, None accepts all
+        :param ids: accepted (vendor, product) pairs, None accepts all
+        :param opener: function opening device node
+        """
+        self.device_dir = device_dir
+        self.names = list(names) if names is not None else None
+        self.phys = list(phys) if phys is not None else None
+        self.ids = set(ids) if ids is not None else None
+        self.opener = opener
+
+        # device path -> opened device / its capabilities
+        self.devices: Dict[str, ev.InputDevice] = {}
+        self.capabilities: Dict[str, Dict[int, List[int]]] = {}
+        # paths that exist but can't be opened (yet) or are filtered out
+        self.ignored: Dict[str, str] = {}
+
+        self.on_attach: List[Callable[[ev.InputDevice], None]] = []
+        self.on_detach: List[Callable[[ev.InputDevice], None]] = []
+
+        self.__inotify_fd: Optional[int] = None
+
+    def fileno(self) -> int:
+        """
+        inotify file descriptor, readable when device directory changes. Lets manager be registered in selector.
+        """
+        if self.__inotify_fd is None:
+            raise DeviceManagerError("Device manager isn't watching, call start() first")
+        return self.__inotify_fd
+
+    @property
+    def watching(self) -> bool:
+        return self.__inotify_fd is not None
+
+    def start(self) -> None:
+        """
+        Start watching device directory and attach all devices already plugged
+        """
+        if self.__inotify_fd is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise DeviceManagerError(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            if libc.inotify_add_watch(fd, os.fsencode(self.device_dir), WATCH_MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise DeviceManagerError(f"Can't watch {self.device_dir}: {os.strerror(errno)}")
+            self.__inotify_fd = fd
+        self.scan()
+
+    def close(self) -> None:
+        """
+        Stop watching and detach all devices
+        """
+        for path in list(self.devices):
+            self.detach(path)
+        if self.__inotify_fd is not None:
+            os.close(self.__inotify_fd)
+            self.__inotify_fd = None
+
+    def scan(self) -> None:
+        """
+        Compare opened devices with device directory, attach new and detach vanished ones
+        """
+        try:
+            paths = {os.path.join(self.device_dir, name) for name in os.listdir(self.device_dir)
+                     if name.startswith("event")}
+        except FileNotFoundError:
+            paths = set()
+        for path in list(self.devices):
+            if path not in paths:
+                self.detach(path)
+        for path in list(self.ignored):
+            if path not in paths:
+                del self.ignored[path]
+        for path in sorted(paths):
+            if path not in self.devices:
+                self.attach(path)
+
+    def process_changes(self) -> None:
+        """
+        Read pending inotify events and attach/detach changed devices. Doesn't block.
+        """
+        try:
+            data = os.read(self.fileno(), 4096)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].split(b'\0', 1)[0].decode()
+            offset += length
+
+            if mask & IN_DELETE_SELF:
+                # whole directory is gone
+                self.scan()
+            elif not name.startswith("event"):
+                continue
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.detach(os.path.join(self.device_dir, name))
+            elif mask & (IN_CREATE | IN_MOVED_TO | IN_ATTRIB):
+                # IN_ATTRIB - udev may change permissions after node is created
+                path = os.path.join(self.device_dir, name)
+                if path not in self.devices:
+                    self.attach(path)
+
+    def matches(self, device: ev.InputDevice) -> bool:
+        """
+        Check if device passes name, phys and ids filters
+        """
+        if self.names is not None and not any(fnmatch(device.name or "", i) for i in self.names):
+            return False
+        if self.phys is not None and not any(fnmatch(device.phys or "", i) for i in self.phys):
+            return False
+        if self.ids is not None and (device.info.vendor, device.info.product) not in self.ids:
+            return False
+        return True
+
+    def attach(self, path: str) -> Optional[ev.InputDevice]:
+        """
+        Open device, cache its capabilities and call on_attach callbacks
+        :return: None if device can't be opened or is filtered out
+        """
+        try:
+            device = self.opener(path)
+        except OSError as e:
+            self.ignored[path] = str(e)
+            return None
+        if not self.matches(device):
+            device.close()
+            self.ignored[path] = "filtered out"
+            return None
+
+        self.ignored.pop(path, None)
+        self.devices[path] = device
+        self.capabilities[path] = device.capabilities(absinfo=False)
+        for callback in self.on_attach:
+            callback(device)
+        return device
+
+    def detach(self, path: str) -> None:
+        """
+        Call on_detach callbacks and close device. Cached capabilities are dropped after callbacks.
+        """
+        device = self.devices.pop(path, None)
+        if device is None:
+            self.ignored.pop(path, None)
+            return
+        try:
+            for callback in self.on_detach:
+                callback(device)
+        finally:
+            self.capabilities.pop(path, None)
+            try:
+                device.close()
+            except OSError:
+                pass
@@ -0,0 +1,649 @@
+import asyncio
+import threading
+import traceback
+from collections import deque
+from inspect import isawaitable
+from time import monotonic, time
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+
+class ActionRecord:
+    """
+    Single action waiting for execution - mapping and arguments it will be called with.
+    Records are pooled by ActionDispatcher and reused after execution, joystick (x, y) payload is kept in slots, so
+    submitting doesn't allocate.
+    """
+    __slots__ = ("action_name", "mapping", "args", "kwargs", "x", "y", "source", "priority", "read_delay",
+                 "submit_time", "queue_depth")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.action_name = None
+        self.mapping = None
+        self.args = ()
+        self.kwargs = None
+        self.x = None
+        self.y = None
+        self.source = None
+        self.priority = 0
+
+        # filled only when dispatcher has metrics hook
+        self.read_delay = None
+        self.submit_time = None
+        self.queue_depth = 0
+
+    def execute(self):
+        """
+        :return: result of action function (coroutine for coroutine functions)
+        """
+        if self.x is not None:
+            return self.mapping.call(x=self.x, y=self.y)
+        elif self.kwargs:
+            return self.mapping.call(*self.args, **self.kwargs)
+        else:
+            return self.mapping.call(*self.args)
+
+    async def aexecute(self):
+        result = self.execute()
+        if isawaitable(result):
+            result = await result
+        return result
+
+
+class TokenBucket:
+    """
+    Rate limit of single input source - rate actions per second on average, at most burst at once
+    """
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.last = monotonic()
+
+    def take(self, now: float) -> bool:
+        tokens = self.tokens + (now - self.last) * self.rate
+        self.tokens = tokens if tokens < self.burst else self.burst
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+async def _awaited(awaitable):
+    return await awaitable
+
+
+class ActionDispatcher:
+    """
+    Runs mapped actions outside of input reading threads.
+    Inputs only submit actions (never blocking), actions are executed either by worker threads (see start), by the
+    caller with run_next/run_pending, or on asyncio loop (see arun and events).
+
+    Per-action policies:
+    "queued" - every submitted action is executed, in order of submission
+    "drop_while_running" - action is dropped if the same action is pending or running
+    "latest_wins" - if the same action is still pending, its arguments are replaced with newer ones
+
+    Every input source (evdev devices, voice, ...) publishes to the same dispatcher, naming itself in submit. Pending
+    actions are executed highest priority first (see set_priority), preempting actions discard pending actions of
+    lower priority, e.g. e-stop discards queued drive commands. Sources can be rate limited (see set_rate_limit) and
+    number of pending actions can be bounded (capacity) - submissions over the limits are dropped, so inputs are never
+    blocked. Preempting actions are never dropped by rate limits or capacity.
+    """
+    POLICIES = ("queued", "drop_while_running", "latest_wins")
+
+    def __init__(self, mapping_object, default_policy: str = "queued", pool_size: int = 256,
+                 capacity: Optional[int] = None):
+        """
+        :param capacity: max number of pending actions, None - unbounded. When dispatcher is full, the oldest pending
+        action of lower priority is evicted, if there is none, submitted action is dropped
+        """
+        self.mapping_object = mapping_object
+        self.default_policy = self.__check_policy(default_policy)
+        self.policies: Dict[str, str] = {}
+        self.capacity = capacity
+        # action name -> priority, actions without one have priority 0
+        self.priorities: Dict[str, int] = {}
+        self.preempting: Set[str] = set()
+        # source name -> its rate limit
+        self.rate_limits: Dict[str, TokenBucket] = {}
+
+        self._cond = threading.Condition()
+        # priority -> pending records in order of submission, priorities are kept in self._levels, highest first
+        self._queues: Dict[int, Deque[ActionRecord]] = {0: deque()}
+        self._levels: List[int] = [0]
+        self._pending_count = 0
+        # pending records of "latest_wins" actions, so they can be updated in place
+        self._latest: Dict[str, ActionRecord] = {}
+        # action name -> number of pending and running records
+        self._active: Dict[str, int] = {}
+        # executed records ready for reuse
+        self.pool_size = pool_size
+        self._free_records: List[ActionRecord] = [ActionRecord() for _ in range(pool_size)]
+
+        self._workers: List[threading.Thread] = []
+        # threads waiting in get
+        self._waiting = 0
+        self._stopping = False
+
+        # counters, see self.stats
+        self.submitted = 0
+        self.executed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.preempted = 0
+        self.evicted = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.max_pending = 0
+        # source name -> counters of its actions, see self.source_stats
+        self._sources: Dict[str, Dict[str, int]] = {}
+
+        # metrics hook (e.g. Metrics.MetricsRegistry), None disables measurements
+        self.metrics = None
+
+        # asyncio loop of arun/events consumer, woken up on every submission
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._async_event: Optional[asyncio.Event] = None
+        # awaitables of actions executed on thread running a loop, see execute
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def __check_policy(cls, policy: str) -> str:
+        if policy == "one_action_at_the_time":
+            return "drop_while_running"
+        if policy not in cls.POLICIES:
+            raise ValueError(f"Unknown policy {policy}, use one of {cls.POLICIES}")
+        return policy
+
+    def set_policy(self, action_name: str, policy: str) -> None:
+        """
+        Set policy of single action, it takes precedence over policy requested by input
+        """
+        self.policies[action_name] = self.__check_policy(policy)
+
+    def set_priority(self, action_name: str, priority: int, preempt: bool = False) -> None:
+        """
+        Pending actions with higher priority are executed first, actions with the same priority in order of submission
+        :param preempt: submitting this action discards all pending actions with lower priority (e.g. e-stop)
+        """
+        with self._cond:
+            if priority not in self._queues:
+                self._queues[priority] = deque()
+                self._levels = sorted(self._queues, reverse=True)
+            if priority:
+                self.priorities[action_name] = priority
+            else:
+                self.priorities.pop(action_name, None)
+            if preempt:
+                self.preempting.add(action_name)
+            else:
+                self.preempting.discard(action_name)
+
+    def set_rate_limit(self, source: str, rate: Optional[float], burst: Optional[float] = None) -> None:
+        """
+        Limit number of actions submitted by source, submissions over the limit are dropped
+        :param rate: actions per second on average, None removes the limit
+        :param burst: max actions submitted at once (rate, at least 1, by default)
+        """
+        with self._cond:
+            if rate is None:
+                self.rate_limits.pop(source, None)
+            else:
+                self.rate_limits[source] = TokenBucket(rate, burst)
+
+    def submit(self, action_name: str, args=(), kwargs=None, policy: Optional[str] = None,
+               event_time: Optional[float] = None, source: str = "default") -> bool:
+        """
+        Schedule action for execution. Never blocks on execution.
+        :param action_name: name of action mapped in self.mapping_object
+        :param args: positional arguments passed to action function
+        :param kwargs: keyword arguments passed to action function
+        :param policy: policy used if action doesn't have its own (default_policy if None)
+        :param event_time: timestamp (time.time) of input event that caused action, used only by metrics
+        :param source: name of input source submitting the action, for rate limits and statistics
+        :return: False if action was dropped
+        """
+        return self.__enqueue(action_name, policy, event_time, source, args, kwargs, None, None)
+
+    def submit_axes(self, action_name: str, x: float, y: float, policy: Optional[str] = None,
+                    event_time: Optional[float] = None, source: str = "default") -> bool:
+        """
+        Schedule joystick action, it will be called with x and y keyword arguments. Same as submit, but doesn't
+        allocate arguments.
+        """
+        return self.__enqueue(action_name, policy, event_time, source, (), None, x, y)
+
+    def __enqueue(self, action_name: str, policy: Optional[str], event_time: Optional[float], source: str, args,
+                  kwargs, x: Optional[float], y: Optional[float]) -> bool:
+        mapping = self.mapping_object.standard_mappings[action_name]
+        policy = self.policies.get(action_name) or policy or self.default_policy
+        if policy not in self.POLICIES:
+            # bound classmethod would be allocated for every submission
+            policy = self.__check_policy(policy)
+        priority = self.priorities.get(action_name, 0)
+
+        metrics = self.metrics
+        # with statement allocates, this is on the path of every event
+        self._cond.acquire()
+        try:
+            self.submitted += 1
+            counters = self._sources.get(source)
+            if counters is None:
+                counters = self._sources[source] = {'submitted': 0, 'executed': 0, 'dropped': 0}
+            counters['submitted'] += 1
+            if policy == "drop_while_running":
+                if self._active.get(action_name, 0):
+                    self.dropped += 1
+                    self.__dropped(action_name, source, "dropped")
+                    return False
+            elif policy == "latest_wins":
+                record = self._latest.get(action_name)
+                if record is not None:
+                    record.args = args
+                    record.kwargs = kwargs
+                    record.x = x
+                    record.y = y
+                    self.coalesced += 1
+                    if metrics is not None:
+                        record.read_delay = time() - event_time if event_time is not None else None
+                        metrics.on_drop(action_name, "coalesced", source)
+                    return True
+
+            if action_name in self.preempting:
+                self.__preempt(priority)
+            else:
+                rate_limit = self.rate_limits.get(source)
+                if rate_limit is not None and not rate_limit.take(monotonic()):
+                    self.rate_limited += 1
+                    self.__dropped(action_name, source, "rate_limited")
+                    return False
+                if self.capacity is not None and self._pending_count >= self.capacity and not self.__evict(priority):
+                    self.rejected += 1
+                    self.__dropped(action_name, source, "rejected")
+                    return False
+
+            record = self._free_records.pop() if self._free_records else ActionRecord()
+            record.action_name = action_name
+            record.mapping = mapping
+            record.args = args
+            record.kwargs = kwargs
+            record.x = x
+            record.y = y
+            record.source = source
+            record.priority = priority
+            if metrics is not None:
+                record.read_delay = time() - event_time if event_time is not None else None
+                record.submit_time = monotonic()
+                record.queue_depth = self._pending_count
+            if policy == "latest_wins":
+                self._latest[action_name] = record
+            self._active[action_name] = self._active.get(action_name, 0) + 1
+            self._queues[priority].append(record)
+            self._pending_count += 1
+            if self._pending_count > self.max_pending:
+                self.max_pending = self._pending_count
+            if self._waiting:
+                # notify allocates even without waiters
+                self._cond.notify()
+        finally:
+            self._cond.release()
+        if self._loop is not None:
+            self.__wake_loop()
+        return True
+
+    def __dropped(self, action_name: str, source: str, reason: str) -> None:
+        self._sources[source]['dropped'] += 1
+        if self.metrics is not None:
+            self.metrics.on_drop(action_name, reason, source)
+
+    def __discard(self, record: ActionRecord, reason: str) -> None:
+        # pending record removed from its queue without execution
+        self._pending_count -= 1
+        if self._latest.get(record.action_name) is record:
+            del self._latest[record.action_name]
+        self.__dropped(record.action_name, record.source, reason)
+        self.__release(record)
+
+    def __preempt(self, priority: int) -> None:
+        for level in self._levels:
+            if level >= priority:
+                continue
+            queue = self._queues[level]
+            while queue:
+                self.preempted += 1
+                self.__discard(queue.popleft(), "preempted")
+
+    def __evict(self, priority: int) -> bool:
+        # make room for action with priority by evicting the oldest pending action with the lowest lower priority
+        for level in reversed(self._levels):
+            if level >= priority:
+                return False
+            queue = self._queues[level]
+            if queue:
+                self.evicted += 1
+                self.__discard(queue.popleft(), "evicted")
+                return True
+        return False
+
+    def __wake_loop(self) -> None:
+        # loop may be detached meanwhile
+        loop, event = self._loop, self._async_event
+        if loop is None or event is None:
+            return
+        if threading.get_ident() == self._loop_thread:
+            event.set()
+        else:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # loop already closed
+                pass
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Optional[ActionRecord]:
+        """
+        Take next pending action. Action has to be passed to self.execute afterwards.
+        :return: None if nothing is pending (non-blocking) or timeout passed
+        """
+        self._cond.acquire()
+        try:
+            if block:
+                end = None if timeout is None else monotonic() + timeout
+                while not (self._pending_count or self._stopping):
+                    if end is None:
+                        remaining = None
+                    else:
+                        remaining = end - monotonic()
+                        if remaining <= 0:
+                            return None
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+            if not self._pending_count:
+                return None
+            for level in self._levels:
+                queue = self._queues[level]
+                if queue:
+                    record = queue.popleft()
+                    break
+            self._pending_count -= 1
+            if self._latest.get(record.action_name) is record:
+                del self._latest[record.action_name]
+            return record
+        finally:
+            self._cond.release()
+
+    def get_nowait(self) -> Optional[ActionRecord]:
+        return self.get(block=False)
+
+    def execute(self, record: ActionRecord) -> None:
+        """
+        Execute action taken with self.get. Record is reused by dispatcher afterwards.
+        Awaitable result is awaited on the loop of arun/events if it's running (in a new loop otherwise). When called
+        on thread running a loop (e.g. run_pending from a coroutine), blocking would deadlock it - the awaitable is
+        scheduled there as a task and the record is finished when it completes.
+        """
+        # nothing is measured without metrics hook
+        start = monotonic() if self.metrics is not None else 0.0
+        scheduled = False
+        try:
+            result = record.execute()
+            if isawaitable(result):
+                try:
+                    running = asyncio.get_running_loop()
+                except RuntimeError:
+                    running = None
+                loop = self._loop
+                if running is not None:
+                    task = running.create_task(self.__finish_awaitable(record, result, start))
+                    # loop keeps only weak references of tasks
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    scheduled = True
+                    return
+                elif loop is not None and loop.is_running():
+                    # coroutine action executed by worker thread
+                    asyncio.run_coroutine_threadsafe(_awaited(result), loop).result()
+                else:
+                    asyncio.run(_awaited(result))
+            self.__observe(record, start)
+        finally:
+            if not scheduled:
+                self.finish(record)
+
+    async def aexecute(self, record: ActionRecord) -> None:
+        """
+        Execute action taken with self.aget on running loop, awaiting it if it returns awaitable
+        """
+        start = monotonic() if self.metrics is not None else 0.0
+        try:
+            await record.aexecute()
+            self.__observe(record, start)
+        finally:
+            self.finish(record)
+
+    async def __finish_awaitable(self, record: ActionRecord, result, start: float) -> None:
+        try:
+            await result
+            self.__observe(record, start)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.finish(record)
+
+    def __observe(self, record: ActionRecord, start: float) -> None:
+        metrics = self.metrics
+        if metrics is not None and record.submit_time is not None:
+            end = monotonic()
+            metrics.on_action(record.action_name, record.read_delay, start - record.submit_time, end - start,
+                              record.queue_depth, record.source)
+
+    def finish(self, record: ActionRecord) -> None:
+        """
+        Mark action as no longer running and recycle its record
+        """
+        self._cond.acquire()
+        try:
+            self.executed += 1
+            self._sources[record.source]['executed'] += 1
+            self.__release(record)
+        finally:
+            self._cond.release()
+
+    def __release(self, record: ActionRecord) -> None:
+        count = self._active[record.action_name] - 1
+        if count:
+            self._active[record.action_name] = count
+        else:
+            del self._active[record.action_name]
+        if len(self._free_records) < self.pool_size:
+            record.clear()
+            self._free_records.append(record)
+
+    def run_next(self, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Execute next pending action in calling thread
+        :return: False if there was nothing to execute
+        """
+        record = self.get(block, timeout)
+        if record is None:
+            return False
+        self.execute(record)
+        return True
+
+    def run_pending(self) -> int:
+        """
+        Execute all actions pending at the moment, without waiting for new ones
+        :return: number of executed actions
+        """
+        executed = 0
+        while self.run_next(block=False):
+            executed += 1
+        return executed
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return self._pending_count
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Snapshot of queue depth and counters of submitted, executed, dropped (drop_while_running), coalesced
+        (latest_wins), preempted, evicted (capacity), rate limited and rejected (capacity) actions
+        """
+        with self._cond:
+            return {
+                'pending': self._pending_count,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'executed': self.executed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'preempted': self.preempted,
+                'evicted': self.evicted,
+                'rate_limited': self.rate_limited,
+                'rejected': self.rejected,
+            }
+
+    def source_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Counters of submitted, executed and dropped (for any reason) actions of every input source
+        """
+        with self._cond:
+            return {source: dict(counters) for source, counters in self._sources.items()}
+
+    def start(self, workers: int = 1) -> None:
+        """
+        Start pool of worker threads executing actions
+        """
+        self._stopping = False
+        for _ in range(workers):
+            worker = threading.Thread(target=self.__work, args=(), daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Stop worker threads after they finish current actions
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._loop is not None:
+            self.__wake_loop()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+
+    def __attach_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._async_event = asyncio.Event()
+            self._loop_thread = threading.get_ident()
+            self._loop = loop
+
+    def __detach_loop(self) -> None:
+        """
+        Called when async consumer exits, coroutine actions taken by worker threads then run in their own loop
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._loop is loop:
+            self._loop = None
+            self._loop_thread = None
+            self._async_event = None
+
+    async def aget(self) -> Optional[ActionRecord]:
+        """
+        Wait on running loop for next pending action. Action has to be passed to self.aexecute (or self.finish)
+        afterwards.
+        :return: None if dispatcher is stopped
+        """
+        self.__attach_loop()
+        while not self._stopping:
+            record = self.get(block=False)
+            if record is not None:
+                return record
+            self._async_event.clear()
+            # check again, submission may have happened before clear
+            record = self.get(block=False)
+            if record is not None:
+                return record
+            await self._async_event.wait()
+        return None
+
+    async def events(self) -> AsyncIterator[ActionRecord]:
+        """
+        Iterate over pending actions on running loop: async for action in dispatcher.events(): await action.aexecute()
+        Record is reused after the next one is taken, don't keep references to it.
+        """
+        try:
+            while True:
+                record = await self.aget()
+                if record is None:
+                    return
+                try:
+                    yield record
+                finally:
+                    self.finish(record)
+        finally:
+            self.__detach_loop()
+
+    async def arun(self, concurrency: int = 8) -> None:
+        """
+        Execute actions on running loop until dispatcher is stopped. Actions are called directly on the loop, ones
+        returning awaitable (coroutine functions or functions returning coroutines) are awaited as tasks, at most
+        concurrency at once (further actions wait in queue).
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = set()
+        try:
+            while True:
+                record = await self.aget()
+                if record is None:
+                    return
+                start = monotonic() if self.metrics is not None else 0.0
+                try:
+                    result = record.execute()
+                except Exception:
+                    traceback.print_exc()
+                    self.finish(record)
+                    continue
+                if isawaitable(result):
+                    await semaphore.acquire()
+                    task = asyncio.ensure_future(self.__run_task(record, result, start, semaphore))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    self.__observe(record, start)
+                    self.finish(record)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            self.__detach_loop()
+
+    async def __run_task(self, record: ActionRecord, result, start: float, semaphore: asyncio.Semaphore) -> None:
+        try:
+            await self.__finish_awaitable(record, result, start)
+        finally:
+            semaphore.release()
+
+    def __work(self) -> None:
+        while not self._stopping:
+            record = self.get()
+            if record is None:
+                continue
+            try:
+                self.execute(record)
+            except Exception:
+                traceback.print_exc()
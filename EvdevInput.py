@@ -1,10 +1,22 @@
+import asyncio
+import heapq
+import selectors
 import threading
-from queue import Queue
+from dataclasses import dataclass, field, replace
+from fnmatch import fnmatch
+from itertools import count
+from math import copysign
+from time import monotonic
 
-from typing import Dict, List, Tuple, Set
+from typing import AsyncIterator, Dict, FrozenSet, List, Tuple, Set, Union, Optional
 import evdev as ev
 
+from Combos import ComboMatcher, ComboTable
+from DeviceManager import DeviceManager
+from Dispatcher import ActionRecord
+from EvdevRecording import EventRecorder
 from MappingClass import MappingClass
+from ShardedReader import DeviceWatcher, ReadyQueue
 
 
 class EvdevDevicesError(Exception):
@@ -12,162 +24,773 @@ class EvdevDevicesError(Exception):
         super().__init__(message)
 
 
+def _names_to_codes(names: Dict[int, Union[str, Tuple[str, ...]]]) -> Dict[str, int]:
+    # evdev lists all aliases of one code as a tuple
+    codes = {}
+    for code, name in names.items():
+        for alias in ((name,) if isinstance(name, str) else name):
+            codes[alias] = code
+    return codes
+
+
+# name -> code of every key/button and abs axis, built once
+EV_KEY_CODES: Dict[str, int] = _names_to_codes(ev.ecodes.keys)
+EV_ABS_CODES: Dict[str, int] = _names_to_codes(ev.ecodes.ABS)
+
+# top level sections of binding profile, see EvdevDeviceInput.compile_profile
+PROFILE_SECTIONS = ("buttons", "joysticks", "chords", "sequences", "long_presses")
+
+
+def _profile_keys(bind: dict, profile_name: str) -> List[str]:
+    keys = bind["keys"]
+    if not isinstance(keys, list) or not keys or not all(isinstance(key, str) for key in keys):
+        raise EvdevDevicesError(f"Malformed profile {profile_name}: keys of {bind['action']} must be non-empty list of "
+                                f"key names, got {keys!r}")
+    return keys
+
+
+def _profile_name(bind: dict, field: str, profile_name: str) -> str:
+    name = bind[field]
+    if not isinstance(name, str):
+        raise EvdevDevicesError(f"Malformed profile {profile_name}: {field} of {bind['action']} must be name (string), "
+                                f"got {name!r}")
+    return name
+
+
+def _profile_seconds(bind: dict, field: str, default: float, profile_name: str) -> float:
+    seconds = bind.get(field, default)
+    if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or not seconds > 0:
+        raise EvdevDevicesError(f"Malformed profile {profile_name}: {field} of {bind['action']} must be positive "
+                                f"number of seconds, got {seconds!r}")
+    return seconds
+
+
+@dataclass(frozen=True)
+class BindingSnapshot:
+    """
+    Immutable set of bindings together with dispatch tables compiled from them, keyed by integer event codes.
+    Tables are never changed - binding creates a new snapshot, so listener can read the current one through a single
+    attribute and whole profiles can be swapped under it without locking.
+    """
+    name: str
+    # action name -> all physical inputs bound to it
+    button_binds: Dict[str, Tuple[Tuple[str, int], ...]]
+    joystick_binds: Dict[str, Tuple[Tuple[str, str], ...]]
+    # (EV_KEY, key code, key state) -> action names
+    key_dispatch: Dict[Tuple[int, int, int], Tuple[str, ...]]
+    # abs code -> (action name, x abs code, y abs code) of every joystick using this axis
+    abs_dispatch: Dict[int, Tuple[Tuple[str, int, int], ...]]
+    joystick_pairs: FrozenSet[Tuple[str, int, int]]
+    # chords, sequences and long presses
+    combos: ComboTable = field(default_factory=ComboTable)
+    # key_dispatch indexed by key state, then key code - looked up per event without building a tuple key
+    key_states: Tuple[Dict[int, Tuple[str, ...]], ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        key_states: Tuple[Dict[int, Tuple[str, ...]], ...] = ({}, {}, {})
+        for (_, code, state), action_names in self.key_dispatch.items():
+            if 0 <= state < len(key_states):
+                key_states[state][code] = action_names
+        object.__setattr__(self, 'key_states', key_states)
+
+    @classmethod
+    def compile(cls, name: str, button_binds: Dict[str, List[Tuple[str, int]]],
+                joystick_binds: Dict[str, List[Tuple[str, str]]],
+                combos: Optional[ComboTable] = None) -> 'BindingSnapshot':
+        """
+        :param button_binds: action name -> (key name, key state) list
+        :param joystick_binds: action name -> (x abs name, y abs name) list
+        :param combos: already compiled combo bindings
+        """
+        key_dispatch: Dict[Tuple[int, int, int], List[str]] = {}
+        for action_name, binds in button_binds.items():
+            for ev_key_name, ev_key_state in binds:
+                code = EV_KEY_CODES.get(ev_key_name)
+                if code is None:
+                    raise EvdevDevicesError(f"Key {ev_key_name} doesn't exist!")
+                key_actions = key_dispatch.setdefault((ev.ecodes.EV_KEY, code, ev_key_state), [])
+                if action_name not in key_actions:
+                    key_actions.append(action_name)
+
+        abs_dispatch: Dict[int, List[Tuple[str, int, int]]] = {}
+        for action_name, binds in joystick_binds.items():
+            for ev_abs_x_name, ev_abs_y_name in binds:
+                x_code = EV_ABS_CODES.get(ev_abs_x_name)
+                y_code = EV_ABS_CODES.get(ev_abs_y_name)
+                if x_code is None or y_code is None:
+                    raise EvdevDevicesError(f"ABS axis {ev_abs_x_name} or {ev_abs_y_name} doesn't exist!")
+                pair = (action_name, x_code, y_code)
+                for code in {x_code, y_code}:
+                    joysticks = abs_dispatch.setdefault(code, [])
+                    if pair not in joysticks:
+                        joysticks.append(pair)
+
+        return cls(name,
+                   {action_name: tuple(dict.fromkeys(binds)) for action_name, binds in button_binds.items()},
+                   {action_name: tuple(dict.fromkeys(binds)) for action_name, binds in joystick_binds.items()},
+                   {key: tuple(action_names) for key, action_names in key_dispatch.items()},
+                   {code: tuple(joysticks) for code, joysticks in abs_dispatch.items()},
+                   frozenset(pair for joysticks in abs_dispatch.values() for pair in joysticks),
+                   combos if combos is not None else ComboTable())
+
+    def bind_key(self, action_name: str, ev_key_name: str, ev_key_state: int = 1) -> 'BindingSnapshot':
+        """
+        :return: copy of this snapshot with one more button bind
+        """
+        code = EV_KEY_CODES.get(ev_key_name)
+        if code is None:
+            raise EvdevDevicesError(f"Key {ev_key_name} doesn't exist!")
+        binds = self.button_binds.get(action_name, ())
+        if (ev_key_name, ev_key_state) in binds:
+            return self
+        button_binds = dict(self.button_binds)
+        button_binds[action_name] = binds + ((ev_key_name, ev_key_state),)
+        key = (ev.ecodes.EV_KEY, code, ev_key_state)
+        key_dispatch = dict(self.key_dispatch)
+        key_actions = key_dispatch.get(key, ())
+        if action_name not in key_actions:
+            key_dispatch[key] = key_actions + (action_name,)
+        return replace(self, button_binds=button_binds, key_dispatch=key_dispatch)
+
+    def bind_joystick(self, action_name: str, ev_abs_x_name: str, ev_abs_y_name: str) -> 'BindingSnapshot':
+        """
+        :return: copy of this snapshot with one more joystick bind
+        """
+        x_code = EV_ABS_CODES.get(ev_abs_x_name)
+        y_code = EV_ABS_CODES.get(ev_abs_y_name)
+        if x_code is None or y_code is None:
+            raise EvdevDevicesError(f"ABS axis {ev_abs_x_name} or {ev_abs_y_name} doesn't exist!")
+        binds = self.joystick_binds.get(action_name, ())
+        if (ev_abs_x_name, ev_abs_y_name) in binds:
+            return self
+        joystick_binds = dict(self.joystick_binds)
+        joystick_binds[action_name] = binds + ((ev_abs_x_name, ev_abs_y_name),)
+        pair = (action_name, x_code, y_code)
+        abs_dispatch = dict(self.abs_dispatch)
+        for code in {x_code, y_code}:
+            joysticks = abs_dispatch.get(code, ())
+            if pair not in joysticks:
+                abs_dispatch[code] = joysticks + (pair,)
+        return replace(self, joystick_binds=joystick_binds, abs_dispatch=abs_dispatch,
+                       joystick_pairs=self.joystick_pairs | {pair})
+
+
+@dataclass
+class AxisCalibration:
+    """
+    Precomputed normalization of one abs axis of one device. Raw value is mapped to <-1, 1> with single multiply-add,
+    then deadzone (max of configured deadzone and kernel flat) and response curve (exponent) are applied.
+    """
+    min: int
+    max: int
+    fuzz: int
+    flat: int
+    deadzone: float
+    curve: float
+    scale: float
+    offset: float
+    outer_scale: float
+
+    @classmethod
+    def from_absinfo(cls, absinfo: ev.AbsInfo, deadzone: float = 0.0, curve: float = 1.0) -> 'AxisCalibration':
+        span = absinfo.max - absinfo.min
+        scale = 2 / span if span else 0.0
+        offset = -absinfo.min * scale - 1
+        deadzone = min(max(deadzone, absinfo.flat * scale), 0.99)
+        return cls(absinfo.min, absinfo.max, absinfo.fuzz, absinfo.flat, deadzone, curve,
+                   scale, offset, 1 / (1 - deadzone))
+
+    def normalize(self, value: int) -> float:
+        tilt = value * self.scale + self.offset
+        if tilt > self.deadzone:
+            tilt = min((tilt - self.deadzone) * self.outer_scale, 1.0)
+        elif tilt < -self.deadzone:
+            tilt = max((tilt + self.deadzone) * self.outer_scale, -1.0)
+        else:
+            return 0.0
+        if self.curve != 1.0:
+            tilt = copysign(abs(tilt) ** self.curve, tilt)
+        return tilt
+
+
 class EvdevDeviceInput:
-    def __init__(self, related_mapping: MappingClass, mode="queued"):
-        self.button_binds: Dict[str, Tuple[str, int]] = {}
-        self.joystick_binds: Dict[str, Tuple[str, str]] = {}
+    def __init__(self, related_mapping: MappingClass, mode="queued", reader="select", frame_mode=False,
+                 device_manager: Optional[DeviceManager] = None):
+        # current binds and dispatch tables, replaced as a whole by binding or switching profile
+        self.bindings = BindingSnapshot.compile("", {}, {})
+        # serializes writers of self.bindings, listener never takes it
+        self.__bind_lock = threading.Lock()
+        # profile name -> (profile it was compiled from, snapshot)
+        self.__compiled_profiles: Dict[str, Tuple[dict, BindingSnapshot]] = {}
 
         self.related_mapping: MappingClass = related_mapping
-        self.maps_to_execute_queue = Queue()
+        self.dispatcher = related_mapping.dispatcher
+        # name this input submits actions under, for dispatcher rate limits and statistics
+        self.source = "evdev"
+
+        # bitset of held buttons (bit per key code) and normalized tilt of every bound abs code
+        self.pressed_mask = 0
+        self.tilted_joysticks: Dict[int, float] = {}
+        # sequences in progress and pending long presses
+        self.__combos = ComboMatcher(self.push_button_on_queue)
+        # default time between presses of a sequence (double-tap) and default long press duration, in seconds
+        self.sequence_window = 0.3
+        self.long_press_duration = 0.8
+
+        # default deadzone of every axis, can be changed per axis with set_axis_response
+        self.joystick_threshold = 0.3
+        # abs code -> (deadzone, curve)
+        self.axis_settings: Dict[int, Tuple[float, float]] = {}
+        # (device path, abs code) -> calibration, built when device is attached
+        self.axis_calibrations: Dict[Tuple[str, int], AxisCalibration] = {}
+
+        # "select" - sleep on devices until input arrives, "poll" - busy loop over read_one(),
+        # "sharded" - thread per device watches it, the listening thread reads the readable device with the highest
+        # priority first
+        self.reader = reader
+        # sharded reader: device name or path pattern -> priority (higher is handled first, default 0)
+        self.device_priorities: Dict[str, int] = {}
+        self.__ready: Optional[ReadyQueue] = None
+        self.__device_watchers: Dict[str, DeviceWatcher] = {}
+        self.__selector: Optional[selectors.BaseSelector] = None
+        # loop of arun, devices are read with its reader callbacks
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__repeat_handle: Optional[asyncio.TimerHandle] = None
+
+        # opens/closes devices as they are (un)plugged
+        self.device_manager = device_manager if device_manager is not None else DeviceManager()
+        self.device_manager.on_attach.append(self.__device_attached)
+        self.device_manager.on_detach.append(self.__device_detached)
+        # seconds between repeats of actions bound to held buttons (state 2) and of tilted joysticks actions
+        self.hold_repeat_interval = 0.05
+        self.joystick_repeat_interval = 0.05
+
+        # if set, every event read is recorded (see EvdevRecording)
+        self.recorder: Optional[EventRecorder] = None
+
+        # buffer events of every device until SYN_REPORT and apply them at once (see apply_frame)
+        self.frame_mode = frame_mode
+        # device path -> events of unfinished frame
+        self.__frames: Dict[str, List[ev.InputEvent]] = {}
+        # paths of devices that reported SYN_DROPPED and wait for resync
+        self.__dropped_devices: Set[str] = set()
+        # deadline heap of repeats: (deadline, sequence number, held key code or joystick (action, x code, y code))
+        self.__repeat_heap: List[Tuple[float, int, Union[int, Tuple[str, int, int]]]] = []
+        self.__scheduled_repeats: Set[Union[int, Tuple[str, int, int]]] = set()
+        self.__repeat_sequence = count()
+
+        # default dispatcher policy of actions pushed by this input, see ActionDispatcher
+        self.mode = mode
+        # joystick actions keep at most one pending call with the freshest (x, y)
+        self.joystick_mode = "latest_wins"
 
-        self.pressed_buttons: Set[str] = set()
-        self.tilted_joysticks: Dict[str, float] = {}
+    @property
+    def pressed_buttons(self) -> Set[int]:
+        """
+        Key codes of held buttons
+        """
+        mask = self.pressed_mask
+        return {code for code in range(mask.bit_length()) if mask >> code & 1}
 
-        self.joystick_threshold = 0.3
+    @property
+    def button_binds(self) -> Dict[str, Tuple[Tuple[str, int], ...]]:
+        return self.bindings.button_binds
 
-        self.mode = mode
-        self.executing = False
-        
-        self.paused = False
-        self.waiting_lock = threading.RLock()
-        self.waiting_cond = threading.Condition(self.waiting_lock)
-       
-
-    def pause(self):
-        self.paused = True
-#         print("locking")
-        self.waiting_lock.acquire()
-#         print("locked")
-        while self.paused:
-            self.waiting_cond.wait()
-        self.waiting_lock.release()
-            
-    def resume(self):
-        self.paused = False
-        self.waiting_lock.acquire()
-        self.waiting_cond.notify_all()
-#         try:
-#             self.waiting_cond.notify_all()
-#         except RuntimeError:
-#             pass
-        self.waiting_lock.release()
-    
-    
-    def push_button_on_queue(self, action_name):
-        mapping = self.related_mapping.standard_mappings[action_name]
-        if self.mode == "queued":
-            self.maps_to_execute_queue.put(mapping.executeAction)
-        elif self.mode == "one_action_at_the_time":
-            if self.maps_to_execute_queue.empty() and (not self.executing) and (not self.paused):
-                self.maps_to_execute_queue.put(mapping.executeAction)
-        self.pause()
-
-    def push_abs_on_queue(self, action_name, x_value, y_value):
-        mapping = self.related_mapping.standard_mappings[action_name]
-        if self.mode == "queued":
-            self.maps_to_execute_queue.put(lambda: mapping.executeAction(x=x_value, y=y_value))
-        elif self.mode == "one_action_at_the_time":
-            if self.maps_to_execute_queue.empty() and (not self.executing):
-                self.maps_to_execute_queue.put(lambda: mapping.executeAction(x=x_value, y=y_value))
-        self.pause()
-
-    def normalize_ABS(self, current_device: ev.device, axis: str, x: int) -> float:
-        dev_infos = current_device.capabilities(verbose=True, absinfo=True)[('EV_ABS', 3)]
-        for key, dev_info in dev_infos:
-            if key[0] == axis:
-                break
-        else:
-            raise EvdevDevicesError(f"plugged devices don't have {axis} ABS event")
+    @property
+    def joystick_binds(self) -> Dict[str, Tuple[Tuple[str, str], ...]]:
+        return self.bindings.joystick_binds
+
+    @property
+    def key_dispatch(self) -> Dict[Tuple[int, int, int], Tuple[str, ...]]:
+        return self.bindings.key_dispatch
+
+    @property
+    def abs_dispatch(self) -> Dict[int, Tuple[Tuple[str, int, int], ...]]:
+        return self.bindings.abs_dispatch
+
+    @property
+    def joystick_pairs(self) -> FrozenSet[Tuple[str, int, int]]:
+        return self.bindings.joystick_pairs
+
+    def push_button_on_queue(self, action_name, event_time=None):
+        self.dispatcher.submit(action_name, (), None, self.mode, event_time, self.source)
+
+    def push_abs_on_queue(self, action_name, x_value, y_value, event_time=None):
+        self.dispatcher.submit_axes(action_name, x_value, y_value, self.joystick_mode, event_time, self.source)
 
-        x_max = dev_info.max
-        x_min = dev_info.min
-        return (x - x_min) / (x_max - x_min) * 2 - 1
+    def normalize_ABS(self, current_device: ev.device, axis: int, x: int) -> float:
+        calibration = self.axis_calibrations.get((current_device.path, axis))
+        if calibration is None:
+            self.calibrate_device(current_device)
+            calibration = self.axis_calibrations.get((current_device.path, axis))
+            if calibration is None:
+                raise EvdevDevicesError(f"plugged devices don't have {ev.ecodes.ABS[axis]} ABS event")
+        return calibration.normalize(x)
+
+    def calibrate_device(self, device: ev.device.InputDevice) -> None:
+        """
+        Query abs axes of a device once and cache their calibration. Has to be called again only when device is
+        (re)plugged.
+        """
+        for code, absinfo in device.capabilities(absinfo=True).get(ev.ecodes.EV_ABS, []):
+            deadzone, curve = self.axis_settings.get(code, (self.joystick_threshold, 1.0))
+            self.axis_calibrations[(device.path, code)] = AxisCalibration.from_absinfo(absinfo, deadzone, curve)
+
+    def forget_device(self, device: ev.device.InputDevice) -> None:
+        """
+        Drop cached calibration of unplugged device
+        """
+        for key in [key for key in self.axis_calibrations if key[0] == device.path]:
+            del self.axis_calibrations[key]
+
+    def set_axis_response(self, ev_abs_name: str, deadzone: float = None, curve: float = 1.0) -> None:
+        """
+        Set deadzone (in normalized units, None means self.joystick_threshold) and response curve exponent of an axis
+        on every device
+        """
+        code = EV_ABS_CODES.get(ev_abs_name)
+        if code is None:
+            raise EvdevDevicesError(f"ABS axis {ev_abs_name} doesn't exist!")
+        if deadzone is None:
+            deadzone = self.joystick_threshold
+        self.axis_settings[code] = (deadzone, curve)
+
+        for key, calibration in self.axis_calibrations.items():
+            if key[1] == code:
+                absinfo = ev.AbsInfo(0, calibration.min, calibration.max, calibration.fuzz, calibration.flat, 0)
+                self.axis_calibrations[key] = AxisCalibration.from_absinfo(absinfo, deadzone, curve)
+
+    def schedule_repeat(self, key: Union[int, Tuple[str, int, int]], interval: float) -> None:
+        """
+        Schedule repeat of actions of held key (key code) or tilted joystick ((action, x code, y code)) if it isn't
+        scheduled yet
+        """
+        if key not in self.__scheduled_repeats:
+            self.__scheduled_repeats.add(key)
+            heapq.heappush(self.__repeat_heap, (monotonic() + interval, next(self.__repeat_sequence), key))
+
+    def next_repeat_deadline(self) -> Optional[float]:
+        """
+        Time (time.monotonic) of the next due repeat, None if nothing is held
+        """
+        deadline = self.__combos.next_deadline()
+        if self.__repeat_heap and (deadline is None or self.__repeat_heap[0][0] < deadline):
+            return self.__repeat_heap[0][0]
+        return deadline
+
+    def push_due_repeats(self, now: float) -> None:
+        """
+        Take care of already pushed buttons (action that happen in loop while button is held) and tilted joysticks,
+        at rate set by self.hold_repeat_interval and self.joystick_repeat_interval
+        """
+        self.__combos.push_due(self.bindings.combos, now)
+        heap = self.__repeat_heap
+        bindings = self.bindings
+        while heap and heap[0][0] <= now:
+            deadline, sequence, key = heapq.heappop(heap)
+            if key.__class__ is int:
+                action_names = bindings.key_states[2].get(key)
+                if not self.pressed_mask >> key & 1 or action_names is None:
+                    self.__scheduled_repeats.discard(key)
+                    continue
+                for action_name in action_names:
+                    self.push_button_on_queue(action_name)
+                interval = self.hold_repeat_interval
+            else:
+                action_name, x_code, y_code = key
+                x = self.tilted_joysticks.get(x_code, 0)
+                y = self.tilted_joysticks.get(y_code, 0)
+                # values inside deadzone are already normalized to 0, joystick may be unbound by profile switch
+                if not (x or y) or key not in bindings.joystick_pairs:
+                    self.__scheduled_repeats.discard(key)
+                    continue
+                self.push_abs_on_queue(action_name, x, y)
+                interval = self.joystick_repeat_interval
+
+            # keep steady rate, but don't burst if repeats fell behind
+            deadline += interval
+            if deadline <= now:
+                deadline = now + interval
+            heapq.heappush(heap, (deadline, sequence, key))
+
+    def handle_event(self, device: ev.device.InputDevice, event: ev.InputEvent) -> None:
+        """
+        Push actions bound to a single event read from device and update held buttons/tilted joysticks state.
+        In frame mode events are only buffered until SYN_REPORT.
+        """
+        if self.recorder is not None:
+            self.recorder.record(device, event)
+        if self.frame_mode:
+            self.__buffer_event(device, event)
+            return
+        # kernel timestamp is needed only for latency metrics
+        event_time = event.timestamp() if self.dispatcher.metrics is not None else None
+        bindings = self.bindings
+        if event.type == ev.ecodes.EV_KEY:  # if event is a button/key:
+            self.__handle_key(bindings, event.code, event.value, None, event_time)
+        elif event.type == ev.ecodes.EV_ABS:  # if event is a joystick:
+            joysticks = self.__update_axis(bindings, device, event.code, event.value)
+            if joysticks is not None:
+                for joystick in joysticks:
+                    self.__push_joystick(joystick, event_time)
+
+    def apply_frame(self, device: ev.device.InputDevice, events: List[ev.InputEvent]) -> None:
+        """
+        Apply all key and axis changes of one frame (events between SYN_REPORTs) at once. Every bound action is pushed
+        at most once per frame, joysticks are pushed after both of their axes are updated. Whole frame is resolved with
+        the same bindings.
+        """
+        bindings = self.bindings
+        pushed_actions: Set[str] = set()
+        # dict used as ordered set
+        changed_joysticks: Dict[Tuple[str, int, int], None] = {}
+        metrics = self.dispatcher.metrics
+        event_time = None
+        for event in events:
+            if metrics is not None:
+                event_time = event.timestamp()
+            if event.type == ev.ecodes.EV_KEY:
+                self.__handle_key(bindings, event.code, event.value, pushed_actions, event_time)
+            elif event.type == ev.ecodes.EV_ABS:
+                joysticks = self.__update_axis(bindings, device, event.code, event.value)
+                if joysticks is not None:
+                    for joystick in joysticks:
+                        changed_joysticks[joystick] = None
+        for joystick in changed_joysticks:
+            self.__push_joystick(joystick, event_time)
+
+    def resync_device(self, device: ev.device.InputDevice, timestamp: float = 0.0) -> None:
+        """
+        Read current key and axis state from device (after SYN_DROPPED) and apply differences as a single frame
+        """
+        sec = int(timestamp)
+        usec = int((timestamp - sec) * 1000000)
+        active_keys = set(device.active_keys())
+        capabilities = device.capabilities(absinfo=False)
+        events = []
+        for code in capabilities.get(ev.ecodes.EV_KEY, []):
+            pressed = code in active_keys
+            if pressed != bool(self.pressed_mask >> code & 1):
+                events.append(ev.InputEvent(sec, usec, ev.ecodes.EV_KEY, code, int(pressed)))
+        for code in capabilities.get(ev.ecodes.EV_ABS, []):
+            if code in self.abs_dispatch:
+                events.append(ev.InputEvent(sec, usec, ev.ecodes.EV_ABS, code, device.absinfo(code).value))
+        self.apply_frame(device, events)
+
+    def __buffer_event(self, device: ev.device.InputDevice, event: ev.InputEvent) -> None:
+        if event.type != ev.ecodes.EV_SYN:
+            if device.path not in self.__dropped_devices:
+                self.__frames.setdefault(device.path, []).append(event)
+        elif event.code == ev.ecodes.SYN_REPORT:
+            frame = self.__frames.pop(device.path, None)
+            if device.path in self.__dropped_devices:
+                # end of frame following SYN_DROPPED, state can be read from device again
+                self.__dropped_devices.discard(device.path)
+                self.resync_device(device, event.timestamp())
+            elif frame:
+                self.apply_frame(device, frame)
+        elif event.code == ev.ecodes.SYN_DROPPED:
+            # kernel buffer overflowed - partial frame is useless
+            self.__frames.pop(device.path, None)
+            self.__dropped_devices.add(device.path)
+
+    def __handle_key(self, bindings: BindingSnapshot, code: int, value: int, pushed_actions: Optional[Set[str]] = None,
+                     event_time: Optional[float] = None) -> None:
+        # put every mapping bound to this key and state (mostly pressed or released) to queue to be executed
+        if value != 0 and value != 1:
+            # kernel autorepeat (2), held actions are repeated by self.push_due_repeats
+            return
+        action_names = bindings.key_states[value].get(code)
+        if action_names is not None:
+            for action_name in action_names:
+                if pushed_actions is not None:
+                    if action_name in pushed_actions:
+                        continue
+                    pushed_actions.add(action_name)
+                self.push_button_on_queue(action_name, event_time)
+
+        # add currently pressed button to self.pressed_mask (later it will help with hold events and combos)
+        if value == 1:
+            self.pressed_mask |= 1 << code
+            if code in bindings.key_states[2]:
+                self.schedule_repeat(code, self.hold_repeat_interval)
+            combos = self.__combos
+            # unrelated key has to break sequences in progress
+            if combos.progress or code in bindings.combos.codes:
+                combos.press(bindings.combos, code, self.pressed_mask, monotonic(), event_time)
+        elif value == 0:
+            self.pressed_mask &= ~(1 << code)
+            if self.__combos.held:
+                self.__combos.release(code)
+
+    def __update_axis(self, bindings: BindingSnapshot, device: ev.device.InputDevice, code: int,
+                      value: int) -> Optional[Tuple[Tuple[str, int, int], ...]]:
+        """
+        Store normalized tilt of bound axis
+        :return: joysticks using this axis, None if axis isn't bound or its tilt didn't change
+        """
+        joysticks = bindings.abs_dispatch.get(code)
+        if joysticks is not None:
+            tilt = self.normalize_ABS(device, code, value)
+            if self.tilted_joysticks.get(code) == tilt:
+                # e.g. noise inside deadzone
+                return None
+            self.tilted_joysticks[code] = tilt
+        return joysticks
+
+    def __push_joystick(self, joystick: Tuple[str, int, int], event_time: Optional[float] = None) -> None:
+        action_name, x_code, y_code = joystick
+        x = self.tilted_joysticks.get(x_code, 0)
+        y = self.tilted_joysticks.get(y_code, 0)
+        self.push_abs_on_queue(action_name, x, y, event_time)
+        if x or y:
+            self.schedule_repeat(joystick, self.joystick_repeat_interval)
+
+    def release_device(self, device: ev.device.InputDevice) -> None:
+        """
+        Release all held buttons and center all axes of (unplugged) device as a single frame, so no action keeps
+        repeating
+        """
+        capabilities = self.device_manager.capabilities.get(device.path)
+        if capabilities is None:
+            capabilities = device.capabilities(absinfo=False)
+        bindings = self.bindings
+        pushed_actions: Set[str] = set()
+        changed_joysticks: Dict[Tuple[str, int, int], None] = {}
+        for code in capabilities.get(ev.ecodes.EV_KEY, []):
+            if self.pressed_mask >> code & 1:
+                self.__handle_key(bindings, code, 0, pushed_actions)
+        for code in capabilities.get(ev.ecodes.EV_ABS, []):
+            joysticks = bindings.abs_dispatch.get(code)
+            if joysticks is not None and self.tilted_joysticks.get(code):
+                self.tilted_joysticks[code] = 0.0
+                for joystick in joysticks:
+                    changed_joysticks[joystick] = None
+        for joystick in changed_joysticks:
+            self.__push_joystick(joystick)
+
+    def __device_attached(self, device: ev.device.InputDevice) -> None:
+        self.calibrate_device(device)
+        if self.__selector is not None:
+            self.__selector.register(device, selectors.EVENT_READ)
+        if self.__loop is not None:
+            self.__loop.add_reader(device.fileno(), self.__read_device_async, device)
+        if self.__ready is not None:
+            watcher = DeviceWatcher(device, self.__ready, self.device_priority(device))
+            self.__device_watchers[device.path] = watcher
+            watcher.start()
+
+    def __device_detached(self, device: ev.device.InputDevice) -> None:
+        if self.__selector is not None:
+            try:
+                self.__selector.unregister(device)
+            except (KeyError, ValueError):
+                pass
+        if self.__loop is not None:
+            self.__loop.remove_reader(device.fileno())
+        watcher = self.__device_watchers.pop(device.path, None)
+        if watcher is not None:
+            watcher.stop()
+        self.__frames.pop(device.path, None)
+        self.__dropped_devices.discard(device.path)
+        self.release_device(device)
+        self.forget_device(device)
 
     def listen_and_push(self) -> None:
         """
-        Read actions from all devices and push them to self.maps_to_execute_queue FIFO queue
+        Read actions from all devices and submit them to self.dispatcher.
+        Devices plugged and unplugged while listening are picked up by self.device_manager.
+        """
+        if self.reader not in ("select", "poll", "sharded"):
+            raise EvdevDevicesError(f"Unknown reader {self.reader}!")
+
+        manager = self.device_manager
+        if self.reader == "select":
+            self.__selector = selectors.DefaultSelector()
+            for device in manager.devices.values():
+                self.__selector.register(device, selectors.EVENT_READ)
+        elif self.reader == "sharded":
+            self.__ready = ReadyQueue()
+            for device in manager.devices.values():
+                self.__device_attached(device)
+        manager.start()
+
+        if self.reader == "select":
+            self.__selector.register(manager, selectors.EVENT_READ)
+            self.__listen_select()
+        elif self.reader == "sharded":
+            self.__listen_sharded()
+        else:
+            self.__listen_poll()
+
+    def __listen_poll(self) -> None:
+        """
+        Busy loop - every pass repeats due held actions and reads one event from every device
         """
-        plugged_devices = self.__get_plugged_devices_list()  # TODO - make list refreshable
+        manager = self.device_manager
         while True:
-            # Take care of already pushed buttons (action that happen in loop while button is held)
-            for button_name in self.pressed_buttons:
-                for action_name, value in self.button_binds.items():
-                    if button_name == value[0] and value[1] == 2:
-                        self.push_button_on_queue(action_name)
-
-            for action_name, value in self.joystick_binds.items():
-                x = 0
-                y = 0
-                if value[0] in self.tilted_joysticks.keys():
-                    x = self.tilted_joysticks[value[0]]
-                if value[1] in self.tilted_joysticks.keys():
-                    y = self.tilted_joysticks[value[1]]
-
-                if abs(x) > self.joystick_threshold or abs(y) > self.joystick_threshold:
-                    self.push_abs_on_queue(action_name, x, y)
+            manager.process_changes()
+            self.push_due_repeats(monotonic())
 
             # Check for new pushed buttons (press or release) or other changed states (like moved joysticks)
-            for device in plugged_devices:
-                event = device.read_one()
+            for device in list(manager.devices.values()):
+                try:
+                    event = device.read_one()
+                except OSError:
+                    # device vanished
+                    manager.detach(device.path)
+                    continue
                 if event is not None:
-                    ev_name_list = []
-                    ev_names = []
-                    if event.type == ev.ecodes.EV_KEY:
-                        ev_names = ev.ecodes.keys[event.code]
-                    elif event.type == ev.ecodes.EV_ABS:
-                        ev_names = ev.ecodes.ABS[event.code]
-
-                    if isinstance(ev_names, List):
-                        ev_name_list.extend(ev_names)
-                    else:
-                        ev_name_list.append(ev_names)
-                        # and iterate over it:
-                    for ev_name in ev_name_list:
-                        # for every name of a button clicked:
-                        ###############################################
-                        if event.type == ev.ecodes.EV_KEY:  # if event is a button/key:
-                            for action_name, value in self.button_binds.items():
-                                if value[0] == ev_name:
-                                    # if this specific key (or joystick etc.) name is defined (we have action bound
-                                    # to it)
-                                    if value[1] == event.value:
-                                        # if value is correct (mostly pressed or released)
-                                        # put proper mapping to queue to be executed
-                                        self.push_button_on_queue(action_name)
-                                        
-                                # add currently pressed button to self.pressed_buttons (later it will help with hold
-                                # events)
-                                if event.value == 1:
-                                    self.pressed_buttons.add(ev_name)
-                                if event.value == 0:
-                                    if ev_name in self.pressed_buttons:
-                                        self.pressed_buttons.remove(ev_name)
-                        #############################################
-                        elif event.type == ev.ecodes.EV_ABS:  # if event is a joystick:
-                            for action_name, value in self.joystick_binds.items():
-                                input_tilt = self.normalize_ABS(device, ev_name, event.value)
-                                if value[0] == ev_name:
-                                    self.tilted_joysticks[value[0]] = input_tilt
-                                    if value[1] not in self.tilted_joysticks.keys():
-                                        self.tilted_joysticks[value[1]] = 0
-                                    self.push_abs_on_queue(action_name, self.tilted_joysticks[value[0]],
-                                                           self.tilted_joysticks[value[1]])
-                                    break
-                                elif value[1] == ev_name:
-                                    self.tilted_joysticks[value[1]] = input_tilt
-                                    if value[0] not in self.tilted_joysticks.keys():
-                                        self.tilted_joysticks[value[0]] = 0
-                                    self.push_abs_on_queue(action_name, self.tilted_joysticks[value[0]],
-                                                           self.tilted_joysticks[value[1]])
-                                    break
-                        
-                    
-
-    def __get_plugged_devices_list(self) -> List[ev.device.InputDevice]:
-        """
-        List all plugged devices.
-        """
-        return [ev.InputDevice(path) for path in ev.list_devices()]
+                    self.handle_event(device, event)
+
+    def __listen_select(self) -> None:
+        """
+        Sleep on all devices file descriptors (and device directory watch) until one of them is readable or next held
+        action repeat is due. Every readable device is drained in bulk.
+        """
+        manager = self.device_manager
+        selector = self.__selector
+        while True:
+            next_repeat = self.next_repeat_deadline()
+            if next_repeat is None:
+                timeout = None
+            else:
+                timeout = max(0.0, next_repeat - monotonic())
+
+            for key, _ in selector.select(timeout):
+                device = key.fileobj
+                if device is manager:
+                    manager.process_changes()
+                else:
+                    self.__drain(device)
+
+            if next_repeat is not None:
+                self.push_due_repeats(monotonic())
+
+    def __listen_sharded(self) -> None:
+        """
+        Every device is watched by its own thread, readable devices are queued by device priority (then in order they
+        became readable) and read here one at a time, so a flooding device can't delay a more important one for longer
+        than one drain and input state is changed only by this thread.
+        """
+        manager = self.device_manager
+        ready = self.__ready
+        # device manager watch is handled before any device
+        manager_watcher = DeviceWatcher(manager, ready, priority=1 << 30)
+        manager_watcher.start()
+        while True:
+            next_repeat = self.next_repeat_deadline()
+            if next_repeat is None:
+                device = ready.get()
+            else:
+                device = ready.get(max(0.0, next_repeat - monotonic()))
+
+            if device is manager:
+                manager.process_changes()
+                manager_watcher.processed()
+            elif device is not None:
+                watcher = self.__device_watchers.get(device.path)
+                if watcher is not None:
+                    self.__drain(device)
+                    # device may have vanished meanwhile, its watcher is stopped then
+                    watcher.processed()
+
+            if next_repeat is not None:
+                self.push_due_repeats(monotonic())
+
+    def device_priority(self, device: ev.device.InputDevice) -> int:
+        """
+        Priority of device in sharded reader - highest of priorities matching its name or path
+        """
+        priorities = [priority for pattern, priority in self.device_priorities.items()
+                      if fnmatch(device.name or "", pattern) or fnmatch(device.path, pattern)]
+        return max(priorities) if priorities else 0
+
+    def set_device_priority(self, pattern: str, priority: int) -> None:
+        """
+        Set priority of devices (matched by name or path pattern) in sharded reader, e.g. e-stop pad should have the
+        highest one
+        """
+        self.device_priorities[pattern] = priority
+
+    def __drain(self, device: ev.device.InputDevice) -> None:
+        """
+        Handle all events waiting in readable device
+        """
+        try:
+            for event in device.read():
+                self.handle_event(device, event)
+        except BlockingIOError:
+            pass
+        except OSError:
+            # device vanished
+            self.device_manager.detach(device.path)
+
+    async def arun(self) -> None:
+        """
+        Asyncio version of listen_and_push - devices are read by reader callbacks of the running loop, held actions are
+        repeated by its timers. Runs until cancelled. Actions still have to be executed, e.g. with
+        self.dispatcher.arun() or self.events().
+        """
+        if self.__loop is not None:
+            raise EvdevDevicesError("Input is already read on asyncio loop!")
+        loop = asyncio.get_running_loop()
+        manager = self.device_manager
+        self.__loop = loop
+        try:
+            for device in manager.devices.values():
+                loop.add_reader(device.fileno(), self.__read_device_async, device)
+            manager.start()
+            loop.add_reader(manager.fileno(), self.__process_changes_async)
+            await loop.create_future()
+        finally:
+            if manager.watching:
+                loop.remove_reader(manager.fileno())
+            for device in manager.devices.values():
+                loop.remove_reader(device.fileno())
+            if self.__repeat_handle is not None:
+                self.__repeat_handle.cancel()
+                self.__repeat_handle = None
+            self.__loop = None
+
+    async def events(self) -> AsyncIterator[ActionRecord]:
+        """
+        Read input on running loop and iterate over submitted actions:
+        async for action in device_input.events(): await action.aexecute()
+        """
+        reader = asyncio.ensure_future(self.arun())
+        try:
+            async for record in self.dispatcher.events():
+                yield record
+        finally:
+            reader.cancel()
+
+    def __read_device_async(self, device: ev.device.InputDevice) -> None:
+        self.__drain(device)
+        self.__schedule_repeats_async()
+
+    def __process_changes_async(self) -> None:
+        self.device_manager.process_changes()
+        self.__schedule_repeats_async()
+
+    def __repeat_async(self) -> None:
+        self.__repeat_handle = None
+        self.push_due_repeats(monotonic())
+        self.__schedule_repeats_async()
+
+    def __schedule_repeats_async(self) -> None:
+        """
+        Keep loop timer set to next repeat deadline (loop time is time.monotonic)
+        """
+        deadline = self.next_repeat_deadline()
+        handle = self.__repeat_handle
+        if handle is not None:
+            if deadline is not None and handle.when() == deadline:
+                return
+            handle.cancel()
+            self.__repeat_handle = None
+        if deadline is not None and self.__loop is not None:
+            self.__repeat_handle = self.__loop.call_at(deadline, self.__repeat_async)
 
     def run(self):
         """
@@ -180,53 +803,158 @@ class EvdevDeviceInput:
         """
         bind specific actions names to (key_name, key_state) tuple
         """
-        if kwargs is None:
-            kwargs = {}
-        if args is None:
-            args = []
-
-        if action_name in self.related_mapping.standard_mappings.keys():
-            if ev_key_name in self.get_EV_KEYs():
-                self.button_binds[action_name] = (ev_key_name, ev_key_state)
-            else:
-                EvdevDevicesError(f"Key {ev_key_name} doesn't exist!")
-        else:
-            EvdevDevicesError(f"action {action_name} isn't mapped!")
+        if action_name not in self.related_mapping.standard_mappings:
+            raise EvdevDevicesError(f"action {action_name} isn't mapped!")
+        with self.__bind_lock:
+            self.bindings = self.bindings.bind_key(action_name, ev_key_name, ev_key_state)
 
     def get_EV_KEYs(self, all_EV_KEYs: bool = True) -> List[str]:
         if all_EV_KEYs:
-            t = list(ev.ecodes.keys.values())
-        else:
-            t = []
-            for device in self.__get_plugged_devices_list():
-                t.extend([i for i, j in device.capabilities(verbose=True)[('EV_KEY', 1)]])
+            return list(EV_KEY_CODES)
 
+        if not self.device_manager.watching:
+            self.device_manager.scan()
         full_list = []
-        for sublist in t:
-            if isinstance(sublist, str):
-                full_list.append(sublist)
-            else:
-                for item in sublist:
-                    full_list.append(item)
-
+        for capabilities in self.device_manager.capabilities.values():
+            for code in capabilities.get(ev.ecodes.EV_KEY, []):
+                names = ev.ecodes.keys.get(code)
+                if isinstance(names, str):
+                    full_list.append(names)
+                elif names is not None:
+                    full_list.extend(names)
         return full_list
 
     def bind_double_EV_ABS(self, action_name, ev_abs_x_name, ev_abs_y_name, args=None, kwargs=None):
-        if kwargs is None:
-            kwargs = {}
-        if args is None:
-            args = []
-
-        if action_name in self.related_mapping.standard_mappings.keys():
-            if ev_abs_x_name in self.get_EV_ABSs() and ev_abs_y_name in self.get_EV_ABSs():
-                self.joystick_binds[action_name] = (ev_abs_x_name, ev_abs_y_name)
-            else:
-                EvdevDevicesError(f"ABS axis {ev_abs_x_name} or {ev_abs_y_name} doesn't exist!")
-        else:
-            EvdevDevicesError(f"action {action_name} isn't mapped!")
+        if action_name not in self.related_mapping.standard_mappings:
+            raise EvdevDevicesError(f"action {action_name} isn't mapped!")
+        with self.__bind_lock:
+            self.bindings = self.bindings.bind_joystick(action_name, ev_abs_x_name, ev_abs_y_name)
 
     def get_EV_ABSs(self):
-        return list(ev.ecodes.ABS.values())
+        return list(EV_ABS_CODES)
+
+    def bind_chord(self, action_name: str, ev_key_names: List[str]) -> None:
+        """
+        bind action to keys held together (e.g. ["BTN_TL", "BTN_TR", "BTN_START"]), it's pushed when the last one is
+        pressed
+        """
+        codes = self.__combo_key_codes(action_name, ev_key_names)
+        with self.__bind_lock:
+            self.bindings = replace(self.bindings, combos=self.bindings.combos.with_chord(action_name, codes))
+
+    def bind_sequence(self, action_name: str, ev_key_names: List[str], window: Optional[float] = None) -> None:
+        """
+        bind action to keys pressed one after another, each within window seconds (None means self.sequence_window)
+        """
+        codes = self.__combo_key_codes(action_name, ev_key_names)
+        if window is None:
+            window = self.sequence_window
+        with self.__bind_lock:
+            self.bindings = replace(self.bindings,
+                                    combos=self.bindings.combos.with_sequence(action_name, codes, window))
+
+    def bind_double_tap(self, action_name: str, ev_key_name: str, window: Optional[float] = None) -> None:
+        self.bind_sequence(action_name, [ev_key_name, ev_key_name], window)
+
+    def bind_long_press(self, action_name: str, ev_key_name: str, duration: Optional[float] = None) -> None:
+        """
+        bind action to key held for duration seconds (None means self.long_press_duration)
+        """
+        code, = self.__combo_key_codes(action_name, [ev_key_name])
+        if duration is None:
+            duration = self.long_press_duration
+        with self.__bind_lock:
+            self.bindings = replace(self.bindings,
+                                    combos=self.bindings.combos.with_long_press(action_name, code, duration))
+
+    def __combo_key_codes(self, action_name: str, ev_key_names: List[str]) -> Tuple[int, ...]:
+        if action_name not in self.related_mapping.standard_mappings:
+            raise EvdevDevicesError(f"action {action_name} isn't mapped!")
+        if not ev_key_names:
+            raise EvdevDevicesError(f"No keys given for action {action_name}!")
+        codes = []
+        for ev_key_name in ev_key_names:
+            code = EV_KEY_CODES.get(ev_key_name)
+            if code is None:
+                raise EvdevDevicesError(f"Key {ev_key_name} doesn't exist!")
+            codes.append(code)
+        return tuple(codes)
+
+    def compile_profile(self, profile: dict, name: str = "") -> BindingSnapshot:
+        """
+        Validate profile and compile it to binding snapshot, profile format:
+        {"buttons": [{"action": "stop", "key": "BTN_SOUTH", "state": 1}, ...],
+         "joysticks": [{"action": "drive", "x": "ABS_X", "y": "ABS_Y"}, ...],
+         "chords": [{"action": "unlock", "keys": ["BTN_TL", "BTN_TR", "BTN_START"]}, ...],
+         "sequences": [{"action": "boost", "keys": ["BTN_NORTH", "BTN_NORTH"], "window": 0.3}, ...],
+         "long_presses": [{"action": "park", "key": "BTN_SELECT", "duration": 0.8}, ...]}
+        ("state" defaults to 1, "window" and "duration" to self.sequence_window and self.long_press_duration).
+        Unmapped actions, unknown keys or axes, unknown sections and malformed entries raise EvdevDevicesError.
+        """
+        button_binds: Dict[str, List[Tuple[str, int]]] = {}
+        joystick_binds: Dict[str, List[Tuple[str, str]]] = {}
+        combos = ComboTable()
+        if not isinstance(profile, dict):
+            raise EvdevDevicesError(f"Malformed profile {name}: expected object, got {type(profile).__name__}")
+        unknown = set(profile) - set(PROFILE_SECTIONS)
+        if unknown:
+            raise EvdevDevicesError(f"Unknown sections {sorted(unknown)} in profile {name}, use {PROFILE_SECTIONS}")
+        try:
+            for bind in profile.get("buttons", []):
+                state = bind.get("state", 1)
+                # bool is int too, but true/false in JSON is most likely a mistake
+                if type(state) is not int or state not in (0, 1, 2):
+                    raise EvdevDevicesError(f"Malformed profile {name}: state of {bind['action']} must be 0, 1 or 2, "
+                                            f"got {state!r}")
+                button_binds.setdefault(bind["action"], []).append((_profile_name(bind, "key", name), state))
+            for bind in profile.get("joysticks", []):
+                joystick_binds.setdefault(bind["action"], []).append((_profile_name(bind, "x", name),
+                                                                      _profile_name(bind, "y", name)))
+            for bind in profile.get("chords", []):
+                combos = combos.with_chord(bind["action"],
+                                           self.__combo_key_codes(bind["action"], _profile_keys(bind, name)))
+            for bind in profile.get("sequences", []):
+                combos = combos.with_sequence(bind["action"],
+                                              self.__combo_key_codes(bind["action"], _profile_keys(bind, name)),
+                                              _profile_seconds(bind, "window", self.sequence_window, name))
+            for bind in profile.get("long_presses", []):
+                code, = self.__combo_key_codes(bind["action"], [_profile_name(bind, "key", name)])
+                combos = combos.with_long_press(bind["action"], code,
+                                                _profile_seconds(bind, "duration", self.long_press_duration, name))
+        except (AttributeError, KeyError, TypeError) as e:
+            raise EvdevDevicesError(f"Malformed profile {name}: {e!r}") from e
+
+        for action_name in [*button_binds, *joystick_binds]:
+            if action_name not in self.related_mapping.standard_mappings:
+                raise EvdevDevicesError(f"action {action_name} isn't mapped!")
+        return BindingSnapshot.compile(name, button_binds, joystick_binds, combos)
+
+    def use_profile(self, name: str) -> None:
+        """
+        Replace all binds with profile loaded by MappingClass.load_profiles. Profile is compiled once, so switching
+        (e.g. drive vs arm control) under running listener is a single attribute swap.
+        """
+        snapshot = self.__compiled_profile(name)
+        with self.__bind_lock:
+            self.bindings = snapshot
+
+    def compile_profiles(self) -> None:
+        """
+        Compile all loaded profiles ahead of time, so errors show up at startup and not at first switch
+        """
+        for name in self.related_mapping.profiles:
+            self.__compiled_profile(name)
+
+    def __compiled_profile(self, name: str) -> BindingSnapshot:
+        profile = self.related_mapping.profiles.get(name)
+        if profile is None:
+            raise EvdevDevicesError(f"Profile {name} isn't loaded!")
+        compiled = self.__compiled_profiles.get(name)
+        # profile may have been reloaded since
+        if compiled is None or compiled[0] is not profile:
+            compiled = (profile, self.compile_profile(profile, name))
+            self.__compiled_profiles[name] = compiled
+        return compiled[1]
 
 
 if __name__ == '__main__':
@@ -282,8 +1010,4 @@ if __name__ == '__main__':
 
     pi.run()
     while True:
-        if not pi.maps_to_execute_queue.empty():
-            pi.executing = True
-            fcn = pi.maps_to_execute_queue.get_nowait()
-            fcn()
-            pi.executing = False
+        mp.dispatcher.run_next()
@@ -0,0 +1,196 @@
+import struct
+from time import monotonic, sleep
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import evdev as ev
+
+# Recording is a sequence of blocks, every one starts with a tag byte:
+# b'D' - device description: index, path, name, phys, key codes and abs axes (with absinfo at the moment of recording)
+# b'E' - event: timestamp, device index, type, code, value
+MAGIC = b'EVRC\x01'
+EVENT = struct.Struct('<cdHHHi')
+DEVICE_HEADER = struct.Struct('<cHHHHHH')
+ABS_AXIS = struct.Struct('<Hiiiiii')
+STRING_LEN = struct.Struct('<H')
+
+
+class EvdevRecordingError(Exception):
+    def __init__(self, message='Broken recording!'):
+        super().__init__(message)
+
+
+class EventRecorder:
+    """
+    Writes raw (timestamp, type, code, value) events of many devices to compact binary file.
+    Device description is written the first time device is seen.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 16):
+        self.file: BinaryIO = open(path, 'wb', buffering=buffer_size)
+        self.file.write(MAGIC)
+        # device path -> index in recording
+        self.devices: Dict[str, int] = {}
+
+    def add_device(self, device: ev.device.InputDevice) -> int:
+        index = self.devices.get(device.path)
+        if index is not None:
+            return index
+        index = len(self.devices)
+        self.devices[device.path] = index
+
+        capabilities = device.capabilities(absinfo=True)
+        keys = capabilities.get(ev.ecodes.EV_KEY, [])
+        axes = capabilities.get(ev.ecodes.EV_ABS, [])
+        strings = [i.encode() for i in (device.path, device.name or "", device.phys or "")]
+        self.file.write(DEVICE_HEADER.pack(b'D', index, len(strings[0]), len(strings[1]), len(strings[2]),
+                                           len(keys), len(axes)))
+        for string in strings:
+            self.file.write(string)
+        self.file.write(struct.pack(f'<{len(keys)}H', *keys))
+        for code, absinfo in axes:
+            self.file.write(ABS_AXIS.pack(code, absinfo.value, absinfo.min, absinfo.max, absinfo.fuzz,
+                                          absinfo.flat, absinfo.resolution))
+        return index
+
+    def record(self, device: ev.device.InputDevice, event: ev.InputEvent) -> None:
+        index = self.devices.get(device.path)
+        if index is None:
+            index = self.add_device(device)
+        self.file.write(EVENT.pack(b'E', event.timestamp(), index, event.type, event.code, event.value))
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplayDevice:
+    """
+    Stands in for ev.InputDevice of recorded device - provides its capabilities (so normalize_ABS works) and current
+    key/axis state (so resync after SYN_DROPPED works)
+    """
+
+    def __init__(self, path: str, name: str, phys: str, keys: List[int], axes: Dict[int, ev.AbsInfo]):
+        self.path = path
+        self.name = name
+        self.phys = phys
+        self.keys = keys
+        self.axes = axes
+        self.pressed: Set[int] = set()
+
+    def capabilities(self, verbose: bool = False, absinfo: bool = True) -> Dict[int, list]:
+        capabilities = {}
+        if self.keys:
+            capabilities[ev.ecodes.EV_KEY] = list(self.keys)
+        if self.axes:
+            if absinfo:
+                capabilities[ev.ecodes.EV_ABS] = list(self.axes.items())
+            else:
+                capabilities[ev.ecodes.EV_ABS] = list(self.axes)
+        return capabilities
+
+    def absinfo(self, code: int) -> ev.AbsInfo:
+        return self.axes[code]
+
+    def active_keys(self) -> List[int]:
+        return list(self.pressed)
+
+    def update(self, event: ev.InputEvent) -> None:
+        """
+        Track state as if event was read from device
+        """
+        if event.type == ev.ecodes.EV_KEY:
+            if event.value:
+                self.pressed.add(event.code)
+            else:
+                self.pressed.discard(event.code)
+        elif event.type == ev.ecodes.EV_ABS and event.code in self.axes:
+            self.axes[event.code] = self.axes[event.code]._replace(value=event.value)
+
+    def close(self) -> None:
+        pass
+
+
+class EventReplay:
+    """
+    Reads recording made by EventRecorder and feeds it to EvdevDeviceInput pipeline
+    """
+
+    def __init__(self, path: str):
+        self.devices: List[ReplayDevice] = []
+        # (timestamp, device index, type, code, value)
+        self.events: List[Tuple[float, int, int, int, int]] = []
+        with open(path, 'rb') as file:
+            self.__load(file.read())
+
+    def __load(self, data: bytes) -> None:
+        if not data.startswith(MAGIC):
+            raise EvdevRecordingError("Not an evdev recording!")
+        offset = len(MAGIC)
+        while offset < len(data):
+            tag = data[offset:offset + 1]
+            if tag == b'E':
+                _, timestamp, index, type_, code, value = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                self.events.append((timestamp, index, type_, code, value))
+            elif tag == b'D':
+                _, index, path_len, name_len, phys_len, keys_len, axes_len = DEVICE_HEADER.unpack_from(data, offset)
+                offset += DEVICE_HEADER.size
+                strings = []
+                for length in (path_len, name_len, phys_len):
+                    strings.append(data[offset:offset + length].decode())
+                    offset += length
+                keys = list(struct.unpack_from(f'<{keys_len}H', data, offset))
+                offset += 2 * keys_len
+                axes = {}
+                for _ in range(axes_len):
+                    code, *absinfo = ABS_AXIS.unpack_from(data, offset)
+                    offset += ABS_AXIS.size
+                    axes[code] = ev.AbsInfo(*absinfo)
+                if index != len(self.devices):
+                    raise EvdevRecordingError(f"Unexpected device index {index}")
+                self.devices.append(ReplayDevice(*strings, keys, axes))
+            else:
+                raise EvdevRecordingError(f"Unknown block {tag!r} at {offset}")
+
+    def __iter__(self) -> Iterator[Tuple[ReplayDevice, ev.InputEvent]]:
+        for timestamp, index, type_, code, value in self.events:
+            sec = int(timestamp)
+            event = ev.InputEvent(sec, int(round((timestamp - sec) * 1000000)), type_, code, value)
+            device = self.devices[index]
+            device.update(event)
+            yield device, event
+
+    def replay(self, device_input, speed: Optional[float] = 1.0) -> int:
+        """
+        Feed recorded events to device_input.handle_event (in calling thread).
+        :param device_input: EvdevDeviceInput
+        :param speed: 1.0 - recorded speed, 2.0 - twice as fast etc., None - as fast as possible (held actions aren't
+        repeated then)
+        :return: number of replayed events
+        """
+        if not self.events:
+            return 0
+        start = monotonic()
+        first_timestamp = self.events[0][0]
+        replayed = 0
+        for device, event in self:
+            if speed:
+                due = start + (event.timestamp() - first_timestamp) / speed
+                while True:
+                    now = monotonic()
+                    if now >= due:
+                        break
+                    next_repeat = device_input.next_repeat_deadline()
+                    if next_repeat is not None and next_repeat < due:
+                        sleep(max(0.0, next_repeat - now))
+                        device_input.push_due_repeats(monotonic())
+                    else:
+                        sleep(due - now)
+            device_input.handle_event(device, event)
+            replayed += 1
+        return replayed
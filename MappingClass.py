@@ -1,52 +1,124 @@
-import json
-from typing import Callable, Optional, Dict
-
-
-def basicActionFunction(name):
-    raise ValueError(f"No function mapped to action {name}")
-
-
-class Mapping:
-    def __init__(self, name, function=None):
-        self.name = name
-
-        self.kwargs = {}
-        self.args = []
-
-        if function is None:
-            self._function = basicActionFunction(name)
-        else:
-            self._function = function
-
-    @property
-    def function(self):
-        return self._function
-
-    @function.setter
-    def function(self, function):
-        if isinstance(function, Callable):
-            self._function = function
-        else:
-            raise ValueError("function must be a callable")
-
-    def executeAction(self, *args, **kwargs):
-        self._function(*self.args, *args, **self.kwargs, **kwargs)
-
-
-class MappingClass:
-    """
-    Class that holds action and axis mapping
-    Action/Axis name is mapped to relevant function
-    """
-
-    def __init__(self):
-        self.standard_mappings: Dict[str, Mapping] = {}
-
-    def map_standard_action(self, name, function):
-        """
-        Map action name to relevant function
-        :param name: name of an action. Function will be later referenced by this name (string)
-        :param function: function that is called when action is executed (callable)
-        :return: None
-        """
-        self.standard_mappings[name] = Mapping(name, function)
+import json
+from functools import partial
+from inspect import iscoroutinefunction
+from typing import Callable, Optional, Dict, List
+
+from Dispatcher import ActionDispatcher
+
+
+def basicActionFunction(name, *args, **kwargs):
+    raise ValueError(f"No function mapped to action {name}")
+
+
+class Mapping:
+    """
+    Action name bound to function. Function is pre-bound with self.args and self.kwargs (functools.partial), so
+    executing action doesn't rebuild them every time.
+    Function may be a coroutine function, executeAction returns coroutine then.
+    """
+    __slots__ = ("name", "_function", "_args", "_kwargs", "_call", "is_coroutine")
+
+    def __init__(self, name, function=None):
+        self.name = name
+
+        self._kwargs = {}
+        self._args = ()
+
+        if function is None:
+            self._function = partial(basicActionFunction, name)
+        else:
+            self._function = function
+        self._bind()
+
+    def _bind(self):
+        self._call = partial(self._function, *self._args, **self._kwargs)
+        self.is_coroutine = iscoroutinefunction(self._function)
+
+    @property
+    def function(self):
+        return self._function
+
+    @function.setter
+    def function(self, function):
+        if isinstance(function, Callable):
+            self._function = function
+            self._bind()
+        else:
+            raise ValueError("function must be a callable")
+
+    @property
+    def args(self):
+        return self._args
+
+    @args.setter
+    def args(self, args):
+        self._args = tuple(args)
+        self._bind()
+
+    @property
+    def kwargs(self):
+        return self._kwargs
+
+    @kwargs.setter
+    def kwargs(self, kwargs):
+        self._kwargs = dict(kwargs)
+        self._bind()
+
+    @property
+    def call(self):
+        """
+        Function pre-bound with self.args and self.kwargs. Calling it directly doesn't build kwargs dict like
+        executeAction does (used by dispatcher for every action).
+        """
+        return self._call
+
+    def executeAction(self, *args, **kwargs):
+        return self._call(*args, **kwargs)
+
+
+class MappingClass:
+    """
+    Class that holds action and axis mapping
+    Action/Axis name is mapped to relevant function
+    """
+
+    def __init__(self, workers: int = 0, capacity: Optional[int] = None):
+        """
+        :param workers: number of threads executing actions. If 0, actions have to be executed by the caller with
+        self.dispatcher.run_next or self.dispatcher.run_pending
+        :param capacity: max number of actions waiting for execution, None - unbounded (see ActionDispatcher)
+        """
+        self.standard_mappings: Dict[str, Mapping] = {}
+        # profile name -> binding profile, compiled by input sources (see load_profiles)
+        self.profiles: Dict[str, dict] = {}
+
+        # every input source submits its actions here
+        self.dispatcher = ActionDispatcher(self, capacity=capacity)
+        if workers:
+            self.dispatcher.start(workers)
+
+    def map_standard_action(self, name, function):
+        """
+        Map action name to relevant function
+        :param name: name of an action. Function will be later referenced by this name (string)
+        :param function: function that is called when action is executed (callable or coroutine function)
+        :return: None
+        """
+        self.standard_mappings[name] = Mapping(name, function)
+
+    def load_profiles(self, path: str) -> List[str]:
+        """
+        Load binding profiles from JSON file, object of profile name -> profile, e.g.:
+        {"drive": {"buttons": [{"action": "stop", "key": "BTN_SOUTH", "state": 1}],
+                   "joysticks": [{"action": "drive", "x": "ABS_X", "y": "ABS_Y"}]},
+         "arm": {...}}
+        Profiles with the same name are replaced. Profiles hold evdev bindings only, unknown sections are rejected when
+        profile is compiled (see EvdevDeviceInput.compile_profile and use_profile).
+        :return: names of loaded profiles
+        """
+        with open(path) as file:
+            profiles = json.load(file)
+        if not isinstance(profiles, dict) or not all(isinstance(i, dict) for i in profiles.values()):
+            raise ValueError(f"{path} must contain object of profile name -> profile object")
+        self.profiles.update(profiles)
+        return list(profiles)
@@ -0,0 +1,139 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LatencyHistogram:
+    """
+    Histogram with power of 2 buckets of microseconds - constant memory, cheap to update.
+    Percentiles are upper bounds of buckets they fall into.
+    """
+    BUCKETS = 40
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        microseconds = int(seconds * 1000000)
+        index = microseconds.bit_length() if microseconds > 0 else 0
+        self.buckets[min(index, self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> float:
+        """
+        :param p: percentile (0-100)
+        :return: upper bound of bucket in seconds
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return min((1 << index) / 1000000, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process metrics hook for ActionDispatcher (dispatcher.metrics = MetricsRegistry()).
+    Per action it keeps histograms of:
+    "read_delay" - kernel event timestamp -> action submitted by input
+    "queue_wait" - submitted -> execution started
+    "execution" - executeAction duration
+    and of queue depth at submission, plus counts of actions dropped for every reason (see on_drop).
+    The same histograms and drop counts are kept per input source (evdev, voice, ...) that submitted the actions.
+    """
+    STAGES = ("read_delay", "queue_wait", "execution")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self.queue_depth: Dict[int, int] = {}
+        self.drops: Dict[str, Dict[str, int]] = {}
+        self.source_histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self.source_drops: Dict[str, Dict[str, int]] = {}
+
+    def on_action(self, action_name: str, read_delay: Optional[float], queue_wait: float, execution: float,
+                  queue_depth: int, source: Optional[str] = None) -> None:
+        """
+        Called by dispatcher after action finished. read_delay is None for actions not caused directly by an event
+        (e.g. held button repeats)
+        """
+        with self._lock:
+            for histograms_of, key in ((self.histograms, action_name), (self.source_histograms, source)):
+                if key is None:
+                    continue
+                histograms = histograms_of.get(key)
+                if histograms is None:
+                    histograms = histograms_of[key] = {stage: LatencyHistogram() for stage in self.STAGES}
+                if read_delay is not None:
+                    histograms["read_delay"].observe(read_delay)
+                histograms["queue_wait"].observe(queue_wait)
+                histograms["execution"].observe(execution)
+            self.queue_depth[queue_depth] = self.queue_depth.get(queue_depth, 0) + 1
+
+    def on_drop(self, action_name: str, reason: str, source: Optional[str] = None) -> None:
+        """
+        Called by dispatcher when action is dropped ("dropped", "rate_limited", "rejected"), merged with pending one
+        ("coalesced") or discarded while pending ("preempted", "evicted")
+        """
+        with self._lock:
+            drops = self.drops.setdefault(action_name, {})
+            drops[reason] = drops.get(reason, 0) + 1
+            if source is not None:
+                drops = self.source_drops.setdefault(source, {})
+                drops[reason] = drops.get(reason, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'actions': {action_name: {stage: histogram.snapshot() for stage, histogram in histograms.items()}
+                            for action_name, histograms in self.histograms.items()},
+                'queue_depth': dict(self.queue_depth),
+                'drops': {action_name: dict(drops) for action_name, drops in self.drops.items()},
+                'sources': {source: {stage: histogram.snapshot() for stage, histogram in histograms.items()}
+                            for source, histograms in self.source_histograms.items()},
+                'source_drops': {source: dict(drops) for source, drops in self.source_drops.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.queue_depth = {}
+            self.drops = {}
+            self.source_histograms = {}
+            self.source_drops = {}
+
+
+class CallbackMetrics:
+    """
+    Metrics hook forwarding every measurement to a callback:
+    callback(action_name, read_delay, queue_wait, execution, queue_depth), sources and drops are ignored
+    """
+
+    def __init__(self, callback: Callable[[str, Optional[float], float, float, int], None]):
+        self.callback = callback
+
+    def on_action(self, action_name: str, read_delay: Optional[float], queue_wait: float, execution: float,
+                  queue_depth: int, source: Optional[str] = None) -> None:
+        self.callback(action_name, read_delay, queue_wait, execution, queue_depth)
+
+    def on_drop(self, action_name: str, reason: str, source: Optional[str] = None) -> None:
+        pass
@@ -0,0 +1,779 @@
+import hmac
+import os
+import selectors
+import socket
+import struct
+import threading
+from collections import deque
+from time import monotonic, time
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import evdev as ev
+
+from DeviceManager import DeviceManager, DeviceManagerError
+from EvdevRecording import ABS_AXIS, ReplayDevice
+
+# Every packet starts with a header: tag, session (random id of sender run), device index, sequence number of the
+# device's packets and sender timestamp (time.time, kernel timestamp of SYN_REPORT for frames). Tags:
+# b'D' - device description: ids, name, phys, key codes and abs axes (with absinfo at the moment device was attached)
+# b'F' - frame: key and axis events between two SYN_REPORTs, axes coalesced to their latest values, followed by
+#        sequence number and key events of the previous frame, so a single lost or overtaken frame can be replayed
+# b'S' - state: held keys and value of every axis, sent periodically - heartbeat and recovery from lost frames
+# b'X' - device was unplugged
+# With shared key, every packet ends with truncated HMAC-SHA256 of the rest of it, packets of senders not knowing the
+# key are rejected. Over TCP every packet is preceded by its length.
+HEADER = struct.Struct('<cIHId')
+DESCRIPTION = struct.Struct('<HHHHHHHH')
+COUNT = struct.Struct('<H')
+EVENT = struct.Struct('<BHi')
+AXIS_VALUE = struct.Struct('<Hi')
+PREVIOUS = struct.Struct('<IH')
+LENGTH = struct.Struct('<H')
+MAC_SIZE = 16
+
+DEFAULT_PORT = 47620
+PROTOCOLS = ("udp", "tcp")
+SEQUENCE_MASK = 0xFFFFFFFF
+
+
+class NetworkBridgeError(Exception):
+    def __init__(self, message='Problem with network bridge!'):
+        super().__init__(message)
+
+
+def _check_protocol(protocol: str) -> str:
+    if protocol not in PROTOCOLS:
+        raise NetworkBridgeError(f"Unknown protocol {protocol}, use one of {PROTOCOLS}")
+    return protocol
+
+
+def _mac(key: bytes, packet: bytes) -> bytes:
+    return hmac.digest(key, packet, 'sha256')[:MAC_SIZE]
+
+
+def _input_event(timestamp: float, type_: int, code: int, value: int) -> ev.InputEvent:
+    sec = int(timestamp)
+    return ev.InputEvent(sec, int((timestamp - sec) * 1000000), type_, code, value)
+
+
+class _SentDevice:
+    """
+    Local device streamed by NetworkSender - its state as sent so far and frame being collected
+    """
+    __slots__ = ("device", "index", "sequence", "pressed", "axes", "rest", "pending_keys", "pending_axes", "dropped",
+                 "previous")
+
+    def __init__(self, device: ev.InputDevice, index: int):
+        self.device = device
+        self.index = index
+        self.sequence = 0
+        self.pressed: Set[int] = set(device.active_keys())
+        self.axes: Dict[int, int] = {code: absinfo.value
+                                     for code, absinfo in device.capabilities(absinfo=True).get(ev.ecodes.EV_ABS, [])}
+        # axis values at the moment device was attached are its rest position
+        self.rest = dict(self.axes)
+        self.pending_keys: List[Tuple[int, int]] = []
+        # dict keeps only the latest value of every axis
+        self.pending_axes: Dict[int, int] = {}
+        # SYN_DROPPED was read, events are ignored until SYN_REPORT and state is read from device
+        self.dropped = False
+        # sequence number and packed key events of the last frame sent
+        self.previous: Tuple[int, List[bytes]] = (0, [])
+
+
+class NetworkSender:
+    """
+    Reads local input devices and streams them to NetworkDeviceManager over UDP or TCP.
+    Events are sent in one compact packet per SYN_REPORT. Axis-only frames read in the same batch are merged, only
+    the latest value of every axis is sent. Held keys and axis values are repeated every heartbeat_interval, so
+    receiver recovers from lost packets and can tell the link is alive.
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_PORT, protocol: str = "udp",
+                 device_manager: Optional[DeviceManager] = None, heartbeat_interval: float = 0.05,
+                 describe_interval: float = 1.0, key: Optional[bytes] = None):
+        """
+        :param host: address of receiver
+        :param key: shared key packets are signed with, the same as receiver's
+        :param device_manager: local devices to stream (all in /dev/input if None)
+        :param heartbeat_interval: seconds between state packets
+        :param describe_interval: seconds between repeated device descriptions (for receivers started later and
+        lost descriptions)
+        """
+        self.address = (host, port)
+        self.protocol = _check_protocol(protocol)
+        self.heartbeat_interval = heartbeat_interval
+        self.describe_interval = describe_interval
+        self.key = key
+        self.session = int.from_bytes(os.urandom(4), 'little')
+
+        self.device_manager = device_manager if device_manager is not None else DeviceManager()
+        self.device_manager.on_attach.append(self.__device_attached)
+        self.device_manager.on_detach.append(self.__device_detached)
+        # device path -> its state
+        self.__devices: Dict[str, _SentDevice] = {}
+        self.__next_index = 0
+
+        self.__socket: Optional[socket.socket] = None
+        self.__selector: Optional[selectors.BaseSelector] = None
+        self.__stop_read, self.__stop_write = os.pipe()
+        self.__stopping = False
+
+        # counters, see self.stats
+        self.packets = 0
+        self.frames = 0
+        self.events = 0
+        self.coalesced = 0
+        self.bytes = 0
+        self.send_errors = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'packets': self.packets, 'frames': self.frames, 'events': self.events, 'coalesced': self.coalesced,
+                'bytes': self.bytes, 'send_errors': self.send_errors}
+
+    def run(self) -> None:
+        """
+        Stream devices until self.stop is called. Devices plugged and unplugged meanwhile are picked up by
+        self.device_manager.
+        """
+        manager = self.device_manager
+        self.__stopping = False
+        self.__selector = selector = selectors.DefaultSelector()
+        selector.register(self.__stop_read, selectors.EVENT_READ)
+        self.__connect()
+        for device in manager.devices.values():
+            self.__device_attached(device)
+        manager.start()
+        selector.register(manager, selectors.EVENT_READ)
+
+        next_heartbeat = monotonic()
+        next_description = next_heartbeat + self.describe_interval
+        try:
+            while not self.__stopping:
+                for key, _ in selector.select(max(0.0, next_heartbeat - monotonic())):
+                    if key.fileobj == self.__stop_read:
+                        os.read(self.__stop_read, 64)
+                    elif key.fileobj is manager:
+                        manager.process_changes()
+                    else:
+                        self.__forward(key.fileobj)
+
+                now = monotonic()
+                if now >= next_heartbeat:
+                    if self.__socket is None:
+                        self.__connect()
+                    if now >= next_description:
+                        for state in list(self.__devices.values()):
+                            self.__describe(state)
+                        next_description = now + self.describe_interval
+                    for state in list(self.__devices.values()):
+                        self.__send_state(state, time())
+                    next_heartbeat = now + self.heartbeat_interval
+        finally:
+            # receiver releases devices at once instead of waiting for its watchdog
+            for state in list(self.__devices.values()):
+                self.__send(state, b'X', time(), b'')
+            selector.close()
+            self.__selector = None
+            if self.__socket is not None:
+                self.__socket.close()
+                self.__socket = None
+
+    def stop(self) -> None:
+        """
+        Make self.run return (from any thread)
+        """
+        self.__stopping = True
+        os.write(self.__stop_write, b'\0')
+
+    def __connect(self) -> None:
+        kind = socket.SOCK_DGRAM if self.protocol == "udp" else socket.SOCK_STREAM
+        sock = None
+        try:
+            family, kind, proto, _, address = socket.getaddrinfo(*self.address, type=kind)[0]
+            sock = socket.socket(family, kind, proto)
+            if self.protocol == "tcp":
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.settimeout(1.0)
+            sock.connect(address)
+            sock.settimeout(None)
+        except OSError:
+            # receiver isn't listening (yet), next heartbeat tries again
+            if sock is not None:
+                sock.close()
+            self.send_errors += 1
+            return
+        self.__socket = sock
+        # new connection - receiver may not know devices
+        for state in list(self.__devices.values()):
+            self.__describe(state)
+
+    def __send(self, state: _SentDevice, tag: bytes, timestamp: float, body: bytes) -> None:
+        state.sequence = (state.sequence + 1) & SEQUENCE_MASK
+        packet = HEADER.pack(tag, self.session, state.index, state.sequence, timestamp) + body
+        if self.key is not None:
+            packet += _mac(self.key, packet)
+        sock = self.__socket
+        if sock is None:
+            self.send_errors += 1
+            return
+        try:
+            if self.protocol == "tcp":
+                sock.sendall(LENGTH.pack(len(packet)) + packet)
+            else:
+                sock.send(packet)
+        except OSError:
+            # e.g. nobody listens on UDP port, TCP connection is reconnected on next heartbeat
+            self.send_errors += 1
+            if self.protocol == "tcp":
+                sock.close()
+                self.__socket = None
+            return
+        self.packets += 1
+        self.bytes += len(packet)
+
+    def __describe(self, state: _SentDevice) -> None:
+        device = state.device
+        capabilities = device.capabilities(absinfo=True)
+        keys = capabilities.get(ev.ecodes.EV_KEY, [])
+        axes = capabilities.get(ev.ecodes.EV_ABS, [])
+        name = (device.name or "").encode()
+        phys = (device.phys or "").encode()
+        info = getattr(device, 'info', None) or ev.DeviceInfo(0, 0, 0, 0)
+        body = [DESCRIPTION.pack(info.bustype, info.vendor, info.product, info.version, len(name), len(phys),
+                                 len(keys), len(axes)),
+                name, phys, struct.pack(f'<{len(keys)}H', *keys)]
+        for code, absinfo in axes:
+            body.append(ABS_AXIS.pack(code, state.rest.get(code, absinfo.value), absinfo.min, absinfo.max,
+                                      absinfo.fuzz, absinfo.flat, absinfo.resolution))
+        self.__send(state, b'D', time(), b''.join(body))
+
+    def __send_state(self, state: _SentDevice, timestamp: float) -> None:
+        keys = sorted(state.pressed)
+        body = [COUNT.pack(len(keys)), struct.pack(f'<{len(keys)}H', *keys), COUNT.pack(len(state.axes))]
+        body.extend(AXIS_VALUE.pack(code, value) for code, value in state.axes.items())
+        self.__send(state, b'S', timestamp, b''.join(body))
+
+    def __send_frame(self, state: _SentDevice, timestamp: float) -> None:
+        keys = []
+        for code, value in state.pending_keys:
+            keys.append(EVENT.pack(ev.ecodes.EV_KEY, code, value))
+            if value:
+                state.pressed.add(code)
+            else:
+                state.pressed.discard(code)
+        axes = []
+        for code, value in state.pending_axes.items():
+            axes.append(EVENT.pack(ev.ecodes.EV_ABS, code, value))
+            state.axes[code] = value
+        previous_sequence, previous_keys = state.previous
+        body = [COUNT.pack(len(keys) + len(axes)), *keys, *axes,
+                PREVIOUS.pack(previous_sequence, len(previous_keys)), *previous_keys]
+        self.frames += 1
+        self.events += len(keys) + len(axes)
+        state.pending_keys = []
+        state.pending_axes = {}
+        self.__send(state, b'F', timestamp, b''.join(body))
+        state.previous = (state.sequence, keys)
+
+    def __forward(self, device: ev.InputDevice) -> None:
+        """
+        Send all complete frames waiting in readable device
+        """
+        state = self.__devices.get(device.path)
+        if state is None:
+            return
+        try:
+            events = list(device.read())
+        except BlockingIOError:
+            return
+        except OSError:
+            # device vanished
+            self.device_manager.detach(device.path)
+            return
+
+        last_report = None
+        for position, event in enumerate(events):
+            if event.type == ev.ecodes.EV_SYN and event.code == ev.ecodes.SYN_REPORT:
+                last_report = position
+        for position, event in enumerate(events):
+            if event.type == ev.ecodes.EV_KEY:
+                if not state.dropped:
+                    state.pending_keys.append((event.code, event.value))
+            elif event.type == ev.ecodes.EV_ABS:
+                if not state.dropped:
+                    if event.code in state.pending_axes:
+                        self.coalesced += 1
+                    state.pending_axes[event.code] = event.value
+            elif event.type == ev.ecodes.EV_SYN:
+                if event.code == ev.ecodes.SYN_REPORT:
+                    if state.dropped:
+                        # kernel buffer overflowed - send whole state instead of lost events
+                        state.dropped = False
+                        state.pressed = set(device.active_keys())
+                        state.axes = {code: device.absinfo(code).value for code in state.axes}
+                        self.__send_state(state, event.timestamp())
+                    elif state.pending_keys or (position == last_report and state.pending_axes):
+                        # axis-only frames are merged with later ones of the same batch
+                        self.__send_frame(state, event.timestamp())
+                elif event.code == ev.ecodes.SYN_DROPPED:
+                    state.dropped = True
+                    state.pending_keys = []
+                    state.pending_axes = {}
+
+    def __device_attached(self, device: ev.InputDevice) -> None:
+        state = self.__devices.get(device.path)
+        if state is None:
+            state = self.__devices[device.path] = _SentDevice(device, self.__next_index)
+            self.__next_index += 1
+        if self.__selector is not None:
+            self.__selector.register(device, selectors.EVENT_READ)
+            self.__describe(state)
+
+    def __device_detached(self, device: ev.InputDevice) -> None:
+        state = self.__devices.pop(device.path, None)
+        if state is None:
+            return
+        if self.__selector is not None:
+            try:
+                self.__selector.unregister(device)
+            except (KeyError, ValueError):
+                pass
+        self.__send(state, b'X', time(), b'')
+
+
+class RemoteDevice(ReplayDevice):
+    """
+    Stands in for ev.InputDevice of device streamed by NetworkSender. Events decoded by receiver thread wait in
+    a queue, pipe makes device readable for selectors and asyncio. Capabilities come from device description, so
+    normalize_ABS works as with local device.
+    """
+
+    def __init__(self, path: str, name: str, phys: str, keys: List[int], axes: Dict[int, ev.AbsInfo],
+                 info: ev.DeviceInfo, sequence: int):
+        super().__init__(path, name, phys, keys, axes)
+        self.info = info
+        # axis values of released device (values at the moment device was attached to sender)
+        self.rest: Dict[int, int] = {code: absinfo.value for code, absinfo in axes.items()}
+        # sequence number of the last accepted packet and time.monotonic it was received
+        self.sequence = sequence
+        self.last_seen = monotonic()
+        # held keys were released by watchdog, state packet presses them again
+        self.released = False
+
+        self._events: Deque[ev.InputEvent] = deque()
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        self._closed = False
+
+    def fileno(self) -> int:
+        return self._read_fd
+
+    def push(self, events: Iterable[Tuple[int, int, int]], timestamp: float) -> None:
+        """
+        Queue (type, code, value) events as one frame (called by receiver thread)
+        """
+        if self._closed:
+            return
+        for type_, code, value in events:
+            event = _input_event(timestamp, type_, code, value)
+            self.update(event)
+            self._events.append(event)
+        self._events.append(_input_event(timestamp, ev.ecodes.EV_SYN, ev.ecodes.SYN_REPORT, 0))
+        try:
+            os.write(self._write_fd, b'\0')
+        except (BlockingIOError, OSError):
+            # pipe is full - already readable, or device was closed meanwhile
+            pass
+
+    def read(self) -> Iterator[ev.InputEvent]:
+        """
+        :raise BlockingIOError: if no event is waiting, same as ev.InputDevice.read
+        """
+        try:
+            os.read(self._read_fd, 4096)
+        except BlockingIOError:
+            pass
+        events = []
+        queue = self._events
+        while queue:
+            events.append(queue.popleft())
+        if not events:
+            raise BlockingIOError()
+        return iter(events)
+
+    def read_one(self) -> Optional[ev.InputEvent]:
+        return self._events.popleft() if self._events else None
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+
+
+class NetworkDeviceManager(DeviceManager):
+    """
+    Device manager of remote devices streamed by NetworkSender, EvdevDeviceInput reads them as if they were local:
+    EvdevDeviceInput(mapping, device_manager=NetworkDeviceManager(port=...)).
+    Packets are received and decoded by a thread. Late (reordered or duplicated) packets are dropped, lost frames are
+    recovered from the next state packet. When nothing comes from a device for stale_timeout, watchdog releases its
+    held keys and returns its axes to rest, device is detached after expire_timeout.
+    Remote devices drive the robot - listen on other than loopback address only with key and/or senders set.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, protocol: str = "udp",
+                 names: Optional[Iterable[str]] = None, phys: Optional[Iterable[str]] = None,
+                 ids: Optional[Iterable[Tuple[int, int]]] = None, stale_timeout: float = 0.25,
+                 expire_timeout: float = 5.0, key: Optional[bytes] = None, senders: Optional[Iterable[str]] = None):
+        """
+        :param host: address to listen on, "0.0.0.0" - all interfaces
+        :param port: port to listen on, 0 - any free one (see self.address after start)
+        :param names: accepted device names patterns, None accepts all (same as in DeviceManager)
+        :param stale_timeout: seconds without packets after which held keys are released
+        :param expire_timeout: seconds without packets after which device is detached
+        :param key: shared key of senders, packets without valid signature are rejected
+        :param senders: IP addresses packets are accepted from, None accepts all
+        """
+        self.protocol = _check_protocol(protocol)
+        self.address = (host, port)
+        super().__init__(f"{protocol}://{host}:{port}", names, phys, ids, opener=self.__open)
+        self.stale_timeout = stale_timeout
+        self.expire_timeout = expire_timeout
+        self.key = key
+        self.senders: Optional[Set[str]] = set(senders) if senders is not None else None
+
+        # (session, device index) -> remote device, changed only by receiver thread (under self.__lock)
+        self.__remote: Dict[Tuple[int, int], RemoteDevice] = {}
+        self.__lock = threading.Lock()
+        self.__socket: Optional[socket.socket] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__wake_read: Optional[int] = None
+        self.__wake_write: Optional[int] = None
+        self.__stop_read: Optional[int] = None
+        self.__stop_write: Optional[int] = None
+
+        # counters, see self.stats
+        self.packets = 0
+        self.frames = 0
+        self.lost = 0
+        self.late = 0
+        self.malformed = 0
+        self.rejected = 0
+        self.undescribed = 0
+        self.resyncs = 0
+        self.recovered = 0
+        self.watchdog_releases = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of received packets and frames, lost (gaps in sequence), late (reordered or duplicated), malformed,
+        rejected (bad signature or unknown sender; TCP connections for senders) and undescribed (of unknown device)
+        packets, state packets that changed state (resyncs), frames replayed from the following frame (recovered)
+        and watchdog releases
+        """
+        return {'packets': self.packets, 'frames': self.frames, 'lost': self.lost, 'late': self.late,
+                'malformed': self.malformed, 'rejected': self.rejected, 'undescribed': self.undescribed,
+                'resyncs': self.resyncs,
+                'recovered': self.recovered, 'watchdog_releases': self.watchdog_releases}
+
+    def fileno(self) -> int:
+        """
+        Readable when remote devices appeared or vanished
+        """
+        if self.__wake_read is None:
+            raise DeviceManagerError("Device manager isn't receiving, call start() first")
+        return self.__wake_read
+
+    @property
+    def watching(self) -> bool:
+        return self.__thread is not None
+
+    def start(self) -> None:
+        """
+        Start receiving and attach remote devices already described
+        """
+        if self.__thread is None:
+            kind = socket.SOCK_DGRAM if self.protocol == "udp" else socket.SOCK_STREAM
+            family, kind, proto, _, address = socket.getaddrinfo(*self.address, type=kind,
+                                                                 flags=socket.AI_PASSIVE)[0]
+            sock = socket.socket(family, kind, proto)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(address)
+                if self.protocol == "tcp":
+                    sock.listen()
+            except OSError as e:
+                sock.close()
+                raise DeviceManagerError(f"Can't listen on {self.address}: {e}")
+            sock.setblocking(False)
+            self.address = sock.getsockname()[:2]
+            self.__socket = sock
+            self.__wake_read, self.__wake_write = os.pipe()
+            os.set_blocking(self.__wake_read, False)
+            os.set_blocking(self.__wake_write, False)
+            self.__stop_read, self.__stop_write = os.pipe()
+            self.__thread = threading.Thread(target=self.__receive, args=(), daemon=True)
+            self.__thread.start()
+        self.scan()
+
+    def close(self) -> None:
+        """
+        Stop receiving and detach all devices
+        """
+        for path in list(self.devices):
+            self.detach(path)
+        if self.__thread is not None:
+            os.write(self.__stop_write, b'\0')
+            self.__thread.join()
+            self.__thread = None
+            self.__socket.close()
+            self.__socket = None
+            for fd in (self.__wake_read, self.__wake_write, self.__stop_read, self.__stop_write):
+                os.close(fd)
+            self.__wake_read = self.__wake_write = self.__stop_read = self.__stop_write = None
+        with self.__lock:
+            remote = list(self.__remote.values())
+            self.__remote = {}
+        for device in remote:
+            device.close()
+
+    def scan(self) -> None:
+        """
+        Attach newly described and detach vanished remote devices
+        """
+        with self.__lock:
+            paths = {device.path for device in self.__remote.values()}
+        for path in list(self.devices):
+            if path not in paths:
+                self.detach(path)
+        for path in list(self.ignored):
+            if path not in paths:
+                del self.ignored[path]
+        for path in sorted(paths):
+            if path not in self.devices and path not in self.ignored:
+                self.attach(path)
+
+    def process_changes(self) -> None:
+        """
+        Attach/detach remote devices announced by receiver thread. Doesn't block.
+        """
+        try:
+            os.read(self.fileno(), 4096)
+        except BlockingIOError:
+            return
+        self.scan()
+
+    def __open(self, path: str) -> RemoteDevice:
+        with self.__lock:
+            for device in self.__remote.values():
+                if device.path == path:
+                    return device
+        raise FileNotFoundError(f"Remote device {path} vanished")
+
+    def __wake(self) -> None:
+        try:
+            os.write(self.__wake_write, b'\0')
+        except BlockingIOError:
+            pass
+
+    def __receive(self) -> None:
+        listener = self.__socket
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(self.__stop_read, selectors.EVENT_READ)
+        # TCP connection -> bytes of unfinished packet
+        buffers: Dict[socket.socket, bytearray] = {}
+        try:
+            while True:
+                for key, _ in selector.select(self.__watchdog(monotonic())):
+                    sock = key.fileobj
+                    if sock == self.__stop_read:
+                        return
+                    if sock is not listener:
+                        self.__receive_stream(sock, buffers, selector)
+                    elif self.protocol == "udp":
+                        senders = self.senders
+                        while True:
+                            try:
+                                data, sender = listener.recvfrom(65535)
+                            except (BlockingIOError, ConnectionRefusedError):
+                                break
+                            if senders is not None and sender[0] not in senders:
+                                self.rejected += 1
+                                continue
+                            self.__handle_packet(data)
+                    else:
+                        try:
+                            connection, sender = listener.accept()
+                        except BlockingIOError:
+                            continue
+                        if self.senders is not None and sender[0] not in self.senders:
+                            self.rejected += 1
+                            connection.close()
+                            continue
+                        connection.setblocking(False)
+                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        buffers[connection] = bytearray()
+                        selector.register(connection, selectors.EVENT_READ)
+        finally:
+            for connection in buffers:
+                connection.close()
+            selector.close()
+
+    def __receive_stream(self, connection: socket.socket, buffers: Dict[socket.socket, bytearray],
+                         selector: selectors.BaseSelector) -> None:
+        try:
+            data = connection.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            # sender disconnected, its devices are left to watchdog
+            selector.unregister(connection)
+            connection.close()
+            del buffers[connection]
+            return
+        buffer = buffers[connection]
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(buffer, offset)
+            start = offset + LENGTH.size
+            if len(buffer) - start < length:
+                break
+            self.__handle_packet(bytes(buffer[start:start + length]))
+            offset = start + length
+        del buffer[:offset]
+
+    def __handle_packet(self, data: bytes) -> None:
+        if self.key is not None:
+            signature = data[-MAC_SIZE:]
+            data = data[:-MAC_SIZE]
+            if len(signature) != MAC_SIZE or not hmac.compare_digest(signature, _mac(self.key, data)):
+                self.rejected += 1
+                return
+        try:
+            tag, session, index, sequence, timestamp = HEADER.unpack_from(data)
+            key = (session, index)
+            device = self.__remote.get(key)
+            if device is None:
+                if tag == b'D':
+                    self.__add_device(key, sequence, data)
+                else:
+                    self.undescribed += 1
+                return
+            difference = (sequence - device.sequence) & SEQUENCE_MASK
+            if not difference or difference > SEQUENCE_MASK >> 1:
+                self.late += 1
+                return
+            self.packets += 1
+            self.lost += difference - 1
+            last_sequence = device.sequence
+            device.sequence = sequence
+            device.last_seen = monotonic()
+            device.released = False
+            if tag == b'F':
+                (count,) = COUNT.unpack_from(data, HEADER.size)
+                start = HEADER.size + COUNT.size
+                events = list(EVENT.iter_unpack(data[start:start + count * EVENT.size]))
+                previous_sequence, previous_count = PREVIOUS.unpack_from(data, start + count * EVENT.size)
+                start += count * EVENT.size + PREVIOUS.size
+                previous_events = list(EVENT.iter_unpack(data[start:start + previous_count * EVENT.size]))
+                if len(events) != count or len(previous_events) != previous_count:
+                    raise ValueError("Truncated frame")
+                if previous_events and 0 < (previous_sequence - last_sequence) & SEQUENCE_MASK <= SEQUENCE_MASK >> 1:
+                    # previous frame was lost or is late - replay its key events first
+                    self.recovered += 1
+                    device.push(previous_events, timestamp)
+                self.frames += 1
+                device.push(events, timestamp)
+            elif tag == b'S':
+                self.__apply_state(device, data, timestamp)
+            elif tag == b'X':
+                with self.__lock:
+                    del self.__remote[key]
+                self.__wake()
+            elif tag != b'D':
+                raise ValueError(f"Unknown packet {tag!r}")
+        except (struct.error, ValueError):
+            self.malformed += 1
+
+    def __add_device(self, key: Tuple[int, int], sequence: int, data: bytes) -> None:
+        offset = HEADER.size
+        bustype, vendor, product, version, name_len, phys_len, keys_len, axes_len = \
+            DESCRIPTION.unpack_from(data, offset)
+        offset += DESCRIPTION.size
+        name = data[offset:offset + name_len].decode()
+        offset += name_len
+        phys = data[offset:offset + phys_len].decode()
+        offset += phys_len
+        keys = list(struct.unpack_from(f'<{keys_len}H', data, offset))
+        offset += 2 * keys_len
+        axes = {}
+        for _ in range(axes_len):
+            code, *absinfo = ABS_AXIS.unpack_from(data, offset)
+            offset += ABS_AXIS.size
+            axes[code] = ev.AbsInfo(*absinfo)
+        self.packets += 1
+        device = RemoteDevice(f"net://{key[0]:08x}/{key[1]}", name, phys, keys, axes,
+                              ev.DeviceInfo(bustype, vendor, product, version), sequence)
+        with self.__lock:
+            self.__remote[key] = device
+        self.__wake()
+
+    def __apply_state(self, device: RemoteDevice, data: bytes, timestamp: float) -> None:
+        """
+        Push differences between state packet and state known so far (there are some only if packets were lost)
+        """
+        offset = HEADER.size
+        (keys_len,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        keys = set(struct.unpack_from(f'<{keys_len}H', data, offset))
+        offset += 2 * keys_len
+        (axes_len,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        axes = AXIS_VALUE.iter_unpack(data[offset:offset + axes_len * AXIS_VALUE.size])
+
+        events = [(ev.ecodes.EV_KEY, code, 0) for code in sorted(device.pressed - keys)]
+        events += [(ev.ecodes.EV_KEY, code, 1) for code in sorted(keys - device.pressed)]
+        for code, value in axes:
+            absinfo = device.axes.get(code)
+            if absinfo is not None and absinfo.value != value:
+                events.append((ev.ecodes.EV_ABS, code, value))
+        if events:
+            self.resyncs += 1
+            device.push(events, timestamp)
+
+    def __watchdog(self, now: float) -> Optional[float]:
+        """
+        Release stale devices and expire silent ones
+        :return: seconds until the next check, None if there are no devices
+        """
+        next_check = None
+        expired = []
+        for key, device in self.__remote.items():
+            if not device.released and now >= device.last_seen + self.stale_timeout:
+                self.__release(device)
+            deadline = device.last_seen + (self.expire_timeout if device.released else self.stale_timeout)
+            if device.released and now >= deadline:
+                expired.append(key)
+            elif next_check is None or deadline < next_check:
+                next_check = deadline
+        if expired:
+            with self.__lock:
+                for key in expired:
+                    del self.__remote[key]
+            self.__wake()
+        return None if next_check is None else max(0.0, next_check - now)
+
+    def __release(self, device: RemoteDevice) -> None:
+        device.released = True
+        self.watchdog_releases += 1
+        events = [(ev.ecodes.EV_KEY, code, 0) for code in sorted(device.pressed)]
+        events += [(ev.ecodes.EV_ABS, code, device.rest[code]) for code, absinfo in device.axes.items()
+                   if absinfo.value != device.rest[code]]
+        if events:
+            device.push(events, time())
@@ -0,0 +1,171 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "'"
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over lowercase characters of many phrases - text is scanned once, whatever number of
+    phrases. Built once, matching state is kept by caller (see TranscriptMatcher).
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases: List[str] = list(dict.fromkeys(phrase.lower() for phrase in phrases if phrase))
+        # state -> char -> next state, state 0 is root
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # state -> indexes of phrases ending in this state (including ones reachable by fail links)
+        self.output: List[Tuple[int, ...]] = [()]
+
+        for index, phrase in enumerate(self.phrases):
+            state = 0
+            for char in phrase:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (index,)
+
+        # breadth first, so fail state of every state is finished before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail if fail != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def step(self, state: int, char: str) -> int:
+        goto = self.goto
+        while True:
+            next_state = goto[state].get(char)
+            if next_state is not None:
+                return next_state
+            if not state:
+                return 0
+            state = self.fail[state]
+
+
+class TranscriptMatcher:
+    """
+    Finds phrases in transcript that grows with every interim recognition result. Only part appended since previous
+    transcript is scanned - if recognizer revised earlier words, matching is rewound to the first changed character.
+    Phrases are matched on word boundaries only ("exit" doesn't match "exiting") and every occurrence is reported once.
+    Occurrence at the very end of transcript is reported when next character arrives, when the same transcript is
+    passed again (interim result is stable, e.g. Vosk partials have no trailing space) or by finish().
+    """
+
+    def __init__(self, phrases: Iterable[str] = ()):
+        self.matcher = PhraseMatcher(phrases)
+        self.reset()
+
+    def set_phrases(self, phrases: Iterable[str]) -> None:
+        """
+        Rebuild automaton, current transcript is scanned again (already reported occurrences aren't reported again)
+        """
+        self.matcher = PhraseMatcher(phrases)
+        text = self.text
+        self.text = ""
+        self.__states = [0]
+        self.__pending = []
+        self.update(text)
+
+    def reset(self) -> None:
+        """
+        Start new transcript (e.g. after final result)
+        """
+        self.text = ""
+        # automaton state after every consumed character, states[i] - after i characters
+        self.__states: List[int] = [0]
+        # (phrase index, start) of occurrences ending at the end of text, waiting for word boundary
+        self.__pending: List[Tuple[int, int]] = []
+        # (phrase, start) of reported occurrences
+        self.__reported: Set[Tuple[str, int]] = set()
+
+    def update(self, transcript: str) -> List[str]:
+        """
+        :param transcript: whole current transcript
+        :return: phrases newly found in it
+        """
+        transcript = transcript.lower()
+        text = self.text
+        if transcript == text:
+            # recognizer settled on this transcript, its end is word boundary
+            return [self.matcher.phrases[index] for index, start in self.__pending
+                    if self.__report(self.matcher.phrases[index], start)]
+        if not transcript.startswith(text):
+            # recognizer revised transcript - rewind to common prefix
+            common = 0
+            for old, new in zip(text, transcript):
+                if old != new:
+                    break
+                common += 1
+            del self.__states[common + 1:]
+            self.__pending = self.__rescan_pending(common)
+            text = text[:common]
+        found = self.__scan(text, transcript[len(text):])
+        self.text = transcript
+        return found
+
+    def finish(self) -> List[str]:
+        """
+        Report occurrences at the very end of transcript and start new one
+        """
+        found = [self.matcher.phrases[index] for index, start in self.__pending
+                 if self.__report(self.matcher.phrases[index], start)]
+        self.reset()
+        return found
+
+    def __report(self, phrase: str, start: int) -> bool:
+        if (phrase, start) in self.__reported:
+            return False
+        self.__reported.add((phrase, start))
+        return True
+
+    def __rescan_pending(self, end: int) -> List[Tuple[int, int]]:
+        # occurrences ending exactly at end, found from state the automaton had there
+        matcher = self.matcher
+        return [(index, end - len(matcher.phrases[index])) for index in matcher.output[self.__states[end]]
+                if self.__starts_word(self.text, end - len(matcher.phrases[index]))]
+
+    @staticmethod
+    def __starts_word(text: str, start: int) -> bool:
+        return start == 0 or not is_word_char(text[start - 1])
+
+    def __scan(self, text: str, delta: str) -> List[str]:
+        matcher = self.matcher
+        phrases = matcher.phrases
+        output = matcher.output
+        states = self.__states
+        pending = self.__pending
+        state = states[-1]
+        position = len(text)
+        found = []
+        text += delta
+        for char in delta:
+            if pending:
+                if not is_word_char(char):
+                    for index, start in pending:
+                        if self.__report(phrases[index], start):
+                            found.append(phrases[index])
+                pending = []
+            state = matcher.step(state, char)
+            states.append(state)
+            position += 1
+            for index in output[state]:
+                start = position - len(phrases[index])
+                if self.__starts_word(text, start):
+                    pending.append((index, start))
+        self.__pending = pending
+        return found
@@ -0,0 +1,190 @@
+import json
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from AudioBuffer import AudioRingBuffer
+
+
+@dataclass
+class Hypothesis:
+    """
+    Interim or final transcript of the current utterance (whole of it, not just new words)
+    """
+    transcript: str
+    # 0-1, None if backend doesn't report it (e.g. Watson interim results)
+    confidence: Optional[float]
+    final: bool
+
+
+class RecognizerBackend:
+    """
+    Speech recognizer used by VoiceInput. recognize() is run in its own thread, reads 16 bit mono audio from buffer
+    until buffer is closed and reports hypotheses through on_hypothesis.
+    SDKs of backends are imported only when backend is created.
+    """
+
+    def recognize(self, audio: AudioRingBuffer, rate: int, on_hypothesis: Callable[[Hypothesis], None],
+                  streaming_gaps: bool = False) -> None:
+        """
+        :param rate: sample rate of audio
+        :param streaming_gaps: audio may stop for long (voice activity detection), backend shouldn't time out
+        """
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        """
+        Called after audio buffer is closed, backends not ending recognize() on closed buffer have to end it here
+        """
+
+
+class WatsonRecognizer(RecognizerBackend):
+    """
+    IBM Watson Speech to Text over websocket
+    """
+
+    def __init__(self, apikey: str, url: str, model: str = "en-GB_BroadbandModel"):
+        from ibm_watson import SpeechToTextV1
+        from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+
+        # initialize speech to text service
+        self.authenticator = IAMAuthenticator(apikey)
+        self.speech_to_text = SpeechToTextV1(authenticator=self.authenticator)
+        self.speech_to_text.set_service_url(url)
+        self.model = model
+        # source of running recognition, Watson reads it until its recording is completed
+        self.audio_source = None
+
+    def recognize(self, audio: AudioRingBuffer, rate: int, on_hypothesis: Callable[[Hypothesis], None],
+                  streaming_gaps: bool = False) -> None:
+        from ibm_watson.websocket import AudioSource
+
+        # audio source reads captured chunks from the buffer, callback receives every interim and final result
+        self.audio_source = AudioSource(audio, True, True)
+        self.speech_to_text.recognize_using_websocket(audio=self.audio_source,
+                                                      content_type=f'audio/l16; rate={rate}',
+                                                      recognize_callback=_watson_callback(on_hypothesis),
+                                                      interim_results=True,
+                                                      inactivity_timeout=-1 if streaming_gaps else 30,
+                                                      model=self.model)
+
+    def stop(self) -> None:
+        audio_source = self.audio_source
+        if audio_source is not None:
+            audio_source.completed_recording()
+            self.audio_source = None
+
+
+def _watson_callback(on_hypothesis: Callable[[Hypothesis], None]):
+    # Watson requires RecognizeCallback subclass, so it can be defined only after SDK is imported
+    from ibm_watson.websocket import RecognizeCallback
+
+    class MyRecognizeCallback(RecognizeCallback):
+        def on_connected(self):
+            print('Connection was successful')
+
+        def on_error(self, error):
+            print('Error received: {}'.format(error))
+
+        def on_inactivity_timeout(self, error):
+            print('Inactivity timeout: {}'.format(error))
+
+        def on_listening(self):
+            print('Service is listening')
+
+        def on_data(self, data):
+            # during recognition on_data receives transcript of the whole utterance so far
+            result = data['results'][0]
+            alternative = result['alternatives'][0]
+            on_hypothesis(Hypothesis(alternative['transcript'], alternative.get('confidence'),
+                                     result.get('final', False)))
+
+        def on_close(self):
+            print("Connection closed")
+
+    return MyRecognizeCallback()
+
+
+def _mean_confidence(words: Optional[List[dict]]) -> Optional[float]:
+    # vosk reports confidence of every word only
+    if not words:
+        return None
+    return sum(word['conf'] for word in words) / len(words)
+
+
+class VoskRecognizer(RecognizerBackend):
+    """
+    Local, in-process recognizer (vosk / Kaldi), no network round-trip. Needs vosk package and a downloaded model.
+    """
+
+    def __init__(self, model_path: str):
+        import vosk
+
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def recognize(self, audio: AudioRingBuffer, rate: int, on_hypothesis: Callable[[Hypothesis], None],
+                  streaming_gaps: bool = False) -> None:
+        recognizer = self.vosk.KaldiRecognizer(self.model, rate)
+        recognizer.SetWords(True)
+        # per word confidence of partial results too, older vosk versions don't have it
+        if hasattr(recognizer, 'SetPartialWords'):
+            recognizer.SetPartialWords(True)
+        partial = None
+        stable = False
+        while True:
+            data = audio.get()
+            if not data:
+                break
+            if recognizer.AcceptWaveform(data):
+                self.__report_final(json.loads(recognizer.Result()), on_hypothesis)
+                partial = None
+            else:
+                result = json.loads(recognizer.PartialResult())
+                transcript = result.get('partial', '')
+                if not transcript:
+                    continue
+                # confidence may rise above threshold while transcript stays the same
+                hypothesis = (transcript, _mean_confidence(result.get('partial_result')))
+                if hypothesis != partial:
+                    partial = hypothesis
+                    stable = False
+                    on_hypothesis(Hypothesis(*hypothesis, False))
+                elif not stable:
+                    # unchanged partial is reported once more, phrase at its very end is fired then
+                    stable = True
+                    on_hypothesis(Hypothesis(*hypothesis, False))
+        self.__report_final(json.loads(recognizer.FinalResult()), on_hypothesis)
+
+    @staticmethod
+    def __report_final(result: dict, on_hypothesis: Callable[[Hypothesis], None]) -> None:
+        if not result.get('text'):
+            return
+        on_hypothesis(Hypothesis(result['text'], _mean_confidence(result.get('result')), True))
+
+
+class ScriptedRecognizer(RecognizerBackend):
+    """
+    Deterministic stand-in for tests and offline runs - reports scripted hypotheses when enough audio was consumed
+    """
+
+    def __init__(self, script: List[Tuple[float, str, Optional[float], bool]]):
+        """
+        :param script: (seconds of audio, transcript, confidence, final), in order of seconds
+        """
+        self.script = list(script)
+        self.consumed_seconds = 0.0
+
+    def recognize(self, audio: AudioRingBuffer, rate: int, on_hypothesis: Callable[[Hypothesis], None],
+                  streaming_gaps: bool = False) -> None:
+        script = iter(self.script)
+        step = next(script, None)
+        consumed = 0
+        while True:
+            data = audio.get()
+            if not data:
+                break
+            consumed += len(data)
+            self.consumed_seconds = consumed / 2 / rate
+            while step is not None and step[0] <= self.consumed_seconds:
+                on_hypothesis(Hypothesis(*step[1:]))
+                step = next(script, None)
@@ -0,0 +1,120 @@
+import heapq
+import os
+import selectors
+import threading
+from itertools import count
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+
+class ReadyQueue:
+    """
+    Readiness notifications of many device watchers, taken by device priority (higher first), then in order they came.
+    Every source has at most one notification waiting - its watcher waits until consumer read the source.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # (-priority, sequence number, source)
+        self._heap: List[Tuple[int, int, object]] = []
+        self._sequence = count()
+        # only added sources may put notifications
+        self._sources: Dict[object, int] = {}
+        self._closed = False
+
+    def add_source(self, source, priority: int = 0) -> None:
+        with self._cond:
+            self._sources.setdefault(source, priority)
+
+    def remove_source(self, source) -> None:
+        """
+        Drop waiting notification of source and reject new ones
+        """
+        with self._cond:
+            if self._sources.pop(source, None) is not None:
+                self._heap = [i for i in self._heap if i[2] is not source]
+                heapq.heapify(self._heap)
+
+    def put(self, source) -> bool:
+        """
+        Notify that source is readable
+        :return: False if queue was closed or source removed
+        """
+        with self._cond:
+            priority = self._sources.get(source)
+            if self._closed or priority is None:
+                return False
+            heapq.heappush(self._heap, (-priority, next(self._sequence), source))
+            self._cond.notify()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[object]:
+        """
+        :return: most important readable source, None on timeout or if queue was closed
+        """
+        with self._cond:
+            end = None if timeout is None else monotonic() + timeout
+            while not self._heap:
+                if self._closed:
+                    return None
+                if end is None:
+                    self._cond.wait()
+                else:
+                    remaining = end - monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            return heapq.heappop(self._heap)[2]
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class DeviceWatcher(threading.Thread):
+    """
+    Thread sleeping on one device (any object with fileno). When the device becomes readable, it's put to ReadyQueue
+    and watcher waits until consumer calls processed() - device is read by the consumer, so watcher threads don't
+    compete with it for the GIL while a device floods.
+    """
+
+    def __init__(self, source, ready: ReadyQueue, priority: int = 0):
+        super().__init__(daemon=True)
+        self.source = source
+        self.ready = ready
+        self.priority = priority
+        self._processed = threading.Event()
+        self._stop_read, self._stop_write = os.pipe()
+        ready.add_source(source, priority)
+
+    def stop(self) -> None:
+        """
+        Stop watching and wait for the thread (called by consumer)
+        """
+        self.ready.remove_source(self.source)
+        os.write(self._stop_write, b'\0')
+        self._processed.set()
+        if self.is_alive():
+            self.join()
+        os.close(self._stop_read)
+        os.close(self._stop_write)
+
+    def processed(self) -> None:
+        self._processed.set()
+
+    def run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self.source, selectors.EVENT_READ)
+        selector.register(self._stop_read, selectors.EVENT_READ)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj == self._stop_read:
+                        return
+                    self._processed.clear()
+                    if not self.ready.put(self.source):
+                        return
+                    self._processed.wait()
+        finally:
+            selector.close()
@@ -0,0 +1,174 @@
+import wave
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # voice activity detection is optional
+    np = None
+
+
+class VoiceActivityDetector:
+    """
+    Energy and zero-crossing based voice activity detection of 16 bit mono audio. Only speech segments (with short
+    pre-roll before them and hangover after them) are forwarded to recognizer, silence and steady noise are dropped.
+    Noise floor adapts while there is no speech and can't stay below the minimum energy of the last noise_window_ms
+    (minimum statistics), so steady noise starting after silence (e.g. motor hum) ends the segment it opened.
+    Energy and zero-crossing rate of all frames of a chunk are computed at once (numpy), only the decision is made
+    frame by frame.
+    """
+    NOISE_BLOCKS = 4
+
+    def __init__(self, rate: int = 16000, frame_ms: int = 20, energy_ratio: float = 4.0, min_energy: float = 1e4,
+                 max_zero_crossings: float = 0.35, hangover_ms: int = 300, preroll_ms: int = 200,
+                 noise_adaptation: float = 0.05, noise_window_ms: int = 2000):
+        """
+        :param energy_ratio: frame is speech when its mean square is this many times above noise floor
+        :param min_energy: mean square always considered silence (int16 units)
+        :param max_zero_crossings: frames crossing zero more often (fraction of samples) are noise, like hiss
+        :param hangover_ms: audio forwarded after the last speech frame, so pauses between words aren't cut
+        :param preroll_ms: audio forwarded before the first speech frame, so quiet word onsets aren't cut
+        :param noise_adaptation: how fast noise floor follows energy of non speech frames (0-1)
+        :param noise_window_ms: noise floor is raised to minimum frame energy over this window, even during speech.
+        Longer window lets longer uninterrupted sounds through, but steady noise is recognized later
+        """
+        if np is None:
+            raise ImportError("Voice activity detection needs numpy")
+        self.rate = rate
+        self.frame_samples = rate * frame_ms // 1000
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.max_zero_crossings = max_zero_crossings
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.noise_adaptation = noise_adaptation
+        self.noise_window_ms = noise_window_ms
+
+        self.noise_floor = None
+        # minimum statistics - window is split into blocks, minima of finished blocks are kept
+        self.__block_frames = max(1, noise_window_ms // frame_ms // self.NOISE_BLOCKS)
+        self.__block_minima: Deque[float] = deque(maxlen=self.NOISE_BLOCKS)
+        self.__block_min = float('inf')
+        self.__block_count = 0
+        self.speaking = False
+        self.__hangover = 0
+        self.__preroll: Deque[bytes] = deque(maxlen=max(0, preroll_ms // frame_ms))
+        # samples of unfinished frame
+        self.__rest = b''
+
+        self.frames = 0
+        self.forwarded_frames = 0
+        self.segments = 0
+
+    def process(self, data: bytes) -> bytes:
+        """
+        :return: part of audio that should be sent to recognizer (often b'')
+        """
+        data = self.__rest + data
+        frame_bytes = self.frame_samples * 2
+        count = len(data) // frame_bytes
+        self.__rest = data[count * frame_bytes:]
+        if not count:
+            return b''
+
+        samples = np.frombuffer(data, dtype=np.int16, count=count * self.frame_samples).reshape(count, -1)
+        floats = samples.astype(np.float32)
+        energies = np.mean(floats * floats, axis=1)
+        signs = np.signbit(samples)
+        zero_crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_samples
+
+        forwarded = []
+        for index in range(count):
+            frame = data[index * frame_bytes:(index + 1) * frame_bytes]
+            if self.__is_speech(float(energies[index]), float(zero_crossings[index])):
+                if not self.speaking:
+                    self.speaking = True
+                    self.segments += 1
+                    forwarded.extend(self.__preroll)
+                    self.forwarded_frames += len(self.__preroll)
+                    self.__preroll.clear()
+                self.__hangover = self.hangover_frames
+            elif self.speaking:
+                self.__hangover -= 1
+                if self.__hangover <= 0:
+                    self.speaking = False
+
+            self.frames += 1
+            if self.speaking:
+                forwarded.append(frame)
+                self.forwarded_frames += 1
+            else:
+                self.__preroll.append(frame)
+        return b''.join(forwarded)
+
+    def __is_speech(self, energy: float, zero_crossings: float) -> bool:
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        speech = (energy > self.min_energy and energy > self.noise_floor * self.energy_ratio
+                  and zero_crossings < self.max_zero_crossings)
+        if not speech:
+            # floor drops at once, rises slowly
+            if energy < self.noise_floor:
+                self.noise_floor = energy
+            else:
+                self.noise_floor += (energy - self.noise_floor) * self.noise_adaptation
+        if energy < self.__block_min:
+            self.__block_min = energy
+        self.__block_count += 1
+        if self.__block_count == self.__block_frames:
+            self.__block_minima.append(self.__block_min)
+            self.__block_min = float('inf')
+            self.__block_count = 0
+            if len(self.__block_minima) == self.NOISE_BLOCKS:
+                window_min = min(self.__block_minima)
+                if window_min > self.noise_floor:
+                    self.noise_floor = window_min
+        return speech
+
+    @property
+    def duty_cycle(self) -> float:
+        """
+        Part of audio forwarded to recognizer
+        """
+        return self.forwarded_frames / self.frames if self.frames else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {'frames': self.frames, 'forwarded_frames': self.forwarded_frames, 'segments': self.segments,
+                'duty_cycle': self.duty_cycle, 'noise_floor': self.noise_floor or 0.0}
+
+    def reset(self) -> None:
+        self.noise_floor = None
+        self.__block_minima.clear()
+        self.__block_min = float('inf')
+        self.__block_count = 0
+        self.speaking = False
+        self.__hangover = 0
+        self.__preroll.clear()
+        self.__rest = b''
+
+
+def detect_wav(path: str, **kwargs) -> Tuple[List[Tuple[float, float]], VoiceActivityDetector]:
+    """
+    Run detector over 16 bit mono WAV file (e.g. recorded robot noise with commands), frame by frame
+    :param kwargs: VoiceActivityDetector parameters
+    :return: (start, end) seconds of forwarded segments and the detector (for its stats)
+    """
+    with wave.open(path, 'rb') as file:
+        if file.getsampwidth() != 2 or file.getnchannels() != 1:
+            raise ValueError(f"{path} isn't 16 bit mono")
+        detector = VoiceActivityDetector(file.getframerate(), **kwargs)
+        segments: List[Tuple[float, float]] = []
+        frame_seconds = detector.frame_samples / detector.rate
+        was_speaking = False
+        while True:
+            data = file.readframes(detector.frame_samples)
+            if not data:
+                break
+            forwarded = len(detector.process(data)) // (detector.frame_samples * 2)
+            if forwarded:
+                end = detector.frames * frame_seconds
+                if was_speaking:
+                    segments[-1] = (segments[-1][0], end)
+                else:
+                    segments.append((end - forwarded * frame_seconds, end))
+            was_speaking = detector.speaking
+    return segments, detector
@@ -1,60 +1,16 @@
 from dataclasses import dataclass
-from typing import Dict, List, Any
-
-import pyaudio
-from ibm_watson import SpeechToTextV1
-from ibm_watson.websocket import RecognizeCallback, AudioSource
 from threading import Thread
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+from time import monotonic
+from typing import Dict, List, Any, Optional, Set
 
+from AudioBuffer import AudioRingBuffer, Resampler, np
 from MappingClass import MappingClass, Mapping
+from PhraseMatcher import TranscriptMatcher
+from Recognizers import Hypothesis, RecognizerBackend, WatsonRecognizer
+from VoiceActivity import VoiceActivityDetector
 
-try:
-    from Queue import Queue, Full
-except ImportError:
-    from queue import Queue, Full
-
-
-# define callback for the speech to text service
-# TODO - zmergować tą klasę z klasą VoiceInput
-class MyRecognizeCallback(RecognizeCallback):
-    def __init__(self, VoiceInputInstance):
-        RecognizeCallback.__init__(self)
-        self.VoiceInputInstance = VoiceInputInstance
-        self.old_trans = None
-
-    def on_transcription(self, transcript):
-        pass
-        # print("  ", transcript['results'][0]['alternatives'][0]['transcript'])
-
-    def on_connected(self):
-        print('Connection was successful')
-
-    def on_error(self, error):
-        print('Error received: {}'.format(error))
-
-    def on_inactivity_timeout(self, error):
-        print('Inactivity timeout: {}'.format(error))
-
-    def on_listening(self):
-        print('Service is listening')
-
-    def on_hypothesis(self, hypothesis):
-        pass
-        # print("hypo:", hypothesis)
-
-    def on_data(self, data):
-        # 5) podczas rozpoznawania on_data otrzymuje obecny stan transkrypcji, od początku recognize_using_websocket
-        trans = data['results'][0]['alternatives'][0]['transcript']
-        if trans != self.old_trans:  # zabezpieczenie aby nie rozpoznawało ciszy
-            print(trans)
-            # 6) transkrypcja jest przekazywana do checkAndExecute aby sprawdzić czy pojawiło się jakieś słowo klucz
-            # i wywołać daną funkcję
-            self.VoiceInputInstance.checkAndExecute(trans)
-            self.old_trans = trans
-
-    def on_close(self):
-        print("Connection closed")
+# pyaudio callback return value (pyaudio.paContinue), pyaudio is imported only when capture starts
+PA_CONTINUE = 0
 
 
 @dataclass
@@ -67,72 +23,152 @@ class VoiceBind:
 
 
 class VoiceInput:
-    def __init__(self, mapping_object: MappingClass, APIKEY: str, URL: str, model: str = "en-GB_BroadbandModel"):
-        self.CHUNK = 1024
-
-        # TODO - dodać settera BUF_MAX_SIZE, aby dało się zmienić dla instancji klasy, powinien też updejtować queue
-        self.BUF_MAX_SIZE = self.CHUNK * 10
-        self.q = Queue(maxsize=int(round(self.BUF_MAX_SIZE / self.CHUNK)))
-
-        # Create an instance of AudioSource
-        self.audio_source = AudioSource(self.q, True, True)
-
-        # initialize variables for recording the speech
-        self.FORMAT = pyaudio.paInt16
+    def __init__(self, mapping_object: MappingClass, APIKEY: Optional[str] = None, URL: Optional[str] = None,
+                 model: str = "en-GB_BroadbandModel", backend: Optional[RecognizerBackend] = None):
+        """
+        :param backend: speech recognizer (see Recognizers), if None Watson is used with APIKEY, URL and model
+        """
+        # frames captured per pyaudio callback, takes effect when stream is (re)started
+        self._chunk = 1024
+
+        # captured audio waits for recognizer in preallocated ring buffer, oldest audio is overwritten when it's full
+        # (see self.buffer.stats())
+        self.buffer = AudioRingBuffer(self._chunk * 2 * 10, self._chunk * 2)
+
+        # initialize variables for recording the speech, None FORMAT means pyaudio.paInt16
+        self.FORMAT = None
         self.CHANNELS = 1
         self.RATE = 48000
+        # audio is downmixed and resampled to this rate before it's sent (if numpy is available), None sends it as is
+        self.SEND_RATE = 16000
+        self.resampler = None
+        # send only speech segments (if numpy is available), see self.vad.stats() for duty cycle
+        self.VAD = True
+        self.vad = None
 
         # initialize speech to text service
-        self.authenticator = IAMAuthenticator(APIKEY)
-        self.speech_to_text = SpeechToTextV1(authenticator=self.authenticator)
-        self.speech_to_text.set_service_url(URL)
-        self.model = model
+        if backend is None:
+            backend = WatsonRecognizer(APIKEY, URL, model)
+        self.backend = backend
         # TODO - dodać własny model
 
         self.stream = None
         self.audio = None
-        self.recognize_thread = None# = Thread(target=self.recognize_using_weboscket, args=())
+        self.recognize_thread = None
+        # transcript of the previous hypothesis, repeated ones are ignored
+        self.old_trans = None
 
         # initlialize mapping
         self.mapping_object = mapping_object
+        self.dispatcher = mapping_object.dispatcher
+        # dispatcher policy of actions pushed by this input, see ActionDispatcher
+        self.mode = "queued"
+        # name this input submits actions under, for dispatcher rate limits and statistics
+        self.source = "voice"
         self.voice_binds: Dict[str, VoiceBind] = {}
 
+        # fire binds as soon as interim hypothesis contains them, otherwise only final results are checked
+        self.fire_on_interim = True
+        # hypotheses with lower confidence are ignored, ones without confidence are treated as if they had
+        # unknown_confidence. Watson doesn't report confidence of interim results, so they can't be gated - they fire
+        # while unknown_confidence >= min_confidence, set it lower to fire Watson binds on final results only.
+        # Vosk partial results have confidence (mean of their words)
+        self.min_confidence = 0.5
+        self.unknown_confidence = 1.0
+        # seconds in which the same bind (all its sentences) isn't fired again, e.g. when recognizer revises transcript
+        self.cooldown = 1.0
+        # action name -> time.monotonic of last firing
+        self.__last_fired: Dict[str, float] = {}
+
+        # self.stop pauses firing (set by user), self.total_stop is set when stop word is heard
         self.stop = False
         self.total_stop = False
-        self.stop_words = ['exit']  # TODO - stop_words ładniej by chyba z geterami seterami działało
-
-        self.action_to_execute = None
-
-        # this function will initiate the recognize service and pass in the AudioSource
-
-    def recognize_using_weboscket(self, *args):
-        # 3) mycallback jest instancją klasy która mówi co ma się dziać w przypadku wystąpienia pewnych wydarzeń podczas
-        # rozpoznawania
-        mycallback = MyRecognizeCallback(self)
-        # 4) rozpoczynam rozpoznawania
-        # audio source to efektywnie kolejka z kolejnymi nagranymi fragmentami. Kolejka ta po wysłaniu kolejnego
-        # fragmentu CHYBA usuwa go "z siebie". Podaje się też mycallback. Jest tam funkcja on data, czyli co ma się
-        # dziać kiedy otrzyma i rozpozna kolejny fragment
-        self.speech_to_text.recognize_using_websocket(audio=self.audio_source,
-                                                      content_type=f'audio/l16; rate={self.RATE}',
-                                                      recognize_callback=mycallback,
-                                                      interim_results=True,
-                                                      model=self.model)
+        # action submitted when stop word is heard, give it high priority with preemption in dispatcher
+        # (dispatcher.set_priority), so it discards queued drive commands
+        self.stop_action: Optional[str] = None
+        # finds stop words and bound sentences in transcript, rebuilt when any of them changes
+        self.transcript_matcher = TranscriptMatcher()
+        # lowercase phrases as reported by transcript_matcher
+        self.__stop_phrases: Set[str] = set()
+        self.__phrase_binds: Dict[str, VoiceBind] = {}
+        self._stop_words: List[str] = []
+        self.stop_words = ['exit']
+
+    @property
+    def CHUNK(self) -> int:
+        return self._chunk
+
+    @CHUNK.setter
+    def CHUNK(self, chunk: int):
+        self._chunk = chunk
+        self.buffer.chunk = chunk * 2
+
+    @property
+    def BUF_MAX_SIZE(self) -> int:
+        """
+        Capacity of capture buffer in bytes
+        """
+        return self.buffer.size
+
+    @BUF_MAX_SIZE.setter
+    def BUF_MAX_SIZE(self, size: int):
+        self.buffer.resize(size)
+
+    @property
+    def send_rate(self) -> int:
+        """
+        Sample rate of audio sent to recognizer
+        """
+        if self.resampler is not None:
+            return self.resampler.rate_out
+        return self.RATE
+
+    def recognize(self):
+        """
+        Run recognizer backend over captured audio until capture is stopped (runs in self.recognize_thread)
+        """
+        self.backend.recognize(self.buffer, self.send_rate, self.on_hypothesis, streaming_gaps=self.vad is not None)
+
+    recognize_using_weboscket = recognize
+
+    def on_hypothesis(self, hypothesis: Hypothesis):
+        """
+        Called by recognizer backend with every interim and final transcript of current utterance
+        """
+        trans = hypothesis.transcript
+        if trans != self.old_trans or hypothesis.final:  # zabezpieczenie aby nie rozpoznawało ciszy
+            print(trans)
+        confidence = hypothesis.confidence
+        if confidence is None:
+            confidence = self.unknown_confidence
+        if confidence >= self.min_confidence and (hypothesis.final or self.fire_on_interim):
+            # transkrypcja jest przekazywana do checkAndExecute aby sprawdzić czy pojawiło się jakieś słowo klucz
+            # i wywołać daną funkcję
+            # repeated interim result is passed too - phrase at its very end is fired once it's stable
+            self.checkAndExecute(trans, hypothesis.final)
+        elif hypothesis.final:
+            # unsure utterance is over, next one starts from scratch
+            self.transcript_matcher.reset()
+        # after final result transcript starts from scratch
+        self.old_trans = None if hypothesis.final else trans
 
     # define callback for pyaudio to store the recording in queue
     def pyaudio_callback(self, in_data, frame_count, time_info, status):
-        try:
-            self.q.put(in_data)
-        except Full:
-            pass  # discard
-        return None, pyaudio.paContinue
+        if self.resampler is not None:
+            in_data = self.resampler.process(in_data)
+        if self.vad is not None:
+            in_data = self.vad.process(in_data)
+            if not in_data:
+                return None, PA_CONTINUE
+        self.buffer.write(in_data)
+        return None, PA_CONTINUE
 
     def start_voice_input(self):
-        # TODO - aby po rozpoznaniu polecenia czyściło bufor (aby to polecenie nie wykonywało się bez przerwy)
-
         self.stop = False
         self.total_stop = False
 
+        import pyaudio
+
         # while not self.total_stop:
         # instantiate pyaudio
         self.audio = pyaudio.PyAudio()
@@ -143,14 +179,26 @@ class VoiceInput:
 
         # TODO - ogarnąć ustawianie audio i ratea w inicie i setter podstawowego urządzenia (list devices i set device)
 
+        if self.SEND_RATE and np is not None and (self.RATE != self.SEND_RATE or self.CHANNELS > 1):
+            self.resampler = Resampler(self.RATE, self.CHANNELS, self.SEND_RATE)
+        else:
+            self.resampler = None
+        # resampled audio is always mono
+        self.buffer.frame_size = 2 if self.resampler is not None else 2 * self.CHANNELS
+        if self.VAD and np is not None and self.buffer.frame_size == 2:
+            self.vad = VoiceActivityDetector(self.send_rate)
+        else:
+            self.vad = None
+        self.buffer.clear()
+
         # open stream using callback
         # 1) otwieram stream z mikrofonu, co self.CHUNK ramek będzie się wywoływała funkcja self.pyaudio_callback.
         # Funkcja ta dodaje kolejny nagrany fragment do kolejki
         # TODO - jakiesz poszukiwanie mikrofonu
 
         self.stream = self.audio.open(
-            format=self.FORMAT,
-            channels=1,
+            format=self.FORMAT if self.FORMAT is not None else pyaudio.paInt16,
+            channels=self.CHANNELS,
             rate=self.RATE,
             input=True,
             frames_per_buffer=self.CHUNK,
@@ -160,26 +208,67 @@ class VoiceInput:
         )
 
         self.stream.start_stream()
-        self.recognize_thread = Thread(target=self.recognize_using_weboscket, args=())
+        self.recognize_thread = Thread(target=self.recognize, args=())
         self.recognize_thread.start()
 
-    def checkAndExecute(self, transcript):
-        print("checkAndExecute")
-        if not self.stop:
-            # 7) w pierwszej kolejności sprawdza słowa "zupełnego" stopu, w tym momencie nie działa
-            # ponieważ jakiekolwiek słowo klucz jest zupełnym stopem
-            for i in self.stop_words:
-                if i in transcript:
-                    self.total_stop = True
-            # 8) później przeszukuje słownik voice_binds i sprawdza czy w transkrypcji
-            # pojawiły się słowa klucze znajdujące się w tym słowniku. Jeżeli tak to wykonuje odpowiednią akcję i
-            # wychodzi z rozpoznawania
-            for i, v_c in self.voice_binds.items():
-                #print(transcript)
-                if i in transcript:
-                    #self.action_to_execute = lambda: v_c.action_map.executeAction(*v_c.args, **v_c.kwargs)
-                    self.action_to_execute = v_c.action_map.executeAction
-                    self.stop = True
+    def stop_voice_input(self):
+        """
+        Stop capture, recognizer finishes with audio captured so far
+        """
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+        self.buffer.close()
+        self.backend.stop()
+        if self.recognize_thread is not None:
+            self.recognize_thread.join()
+            self.recognize_thread = None
+
+    @property
+    def stop_words(self) -> List[str]:
+        return list(self._stop_words)
+
+    @stop_words.setter
+    def stop_words(self, stop_words: List[str]):
+        self._stop_words = list(stop_words)
+        self.__update_phrases()
+
+    def __update_phrases(self):
+        self.__stop_phrases = {i.lower() for i in self._stop_words}
+        self.__phrase_binds = {i.lower(): v_c for i, v_c in self.voice_binds.items()}
+        self.transcript_matcher.set_phrases([*self._stop_words, *self.voice_binds])
+
+    def checkAndExecute(self, transcript, final=False):
+        """
+        Find stop words and bound sentences in (interim) transcript and submit bound actions to self.dispatcher.
+        Only part of transcript appended since previous call is scanned and every occurrence is found once, the same
+        bind isn't fired again within self.cooldown. Recognition keeps running - there is nothing to re-arm.
+        :param final: transcript is final, next one starts from scratch
+        """
+        found = self.transcript_matcher.update(transcript)
+        if final:
+            found += self.transcript_matcher.finish()
+        if self.stop:
+            return
+        now = monotonic()
+        for phrase in found:
+            # 7) w pierwszej kolejności sprawdza słowa "zupełnego" stopu
+            if phrase in self.__stop_phrases:
+                self.total_stop = True
+                if self.stop_action is not None:
+                    self.dispatcher.submit(self.stop_action, (), None, self.mode, None, self.source)
+            # 8) później sprawdza słowa klucze z voice_binds. Jeżeli tak to wykonuje odpowiednią akcję
+            v_c = self.__phrase_binds.get(phrase)
+            if v_c is not None:
+                last_fired = self.__last_fired.get(v_c.action_name)
+                if last_fired is not None and now - last_fired < self.cooldown:
+                    continue
+                self.__last_fired[v_c.action_name] = now
+                self.dispatcher.submit(v_c.action_name, v_c.args, v_c.kwargs, self.mode, None, self.source)
 
     def bind_sentence(self, action_name: str, voice_inputs: List[str], args=None, kwargs=None):
         if args is None:
@@ -192,6 +281,7 @@ class VoiceInput:
                                    kwargs=kwargs)
             for i in voice_inputs:
                 self.voice_binds[i] = voice_bind
+            self.__update_phrases()
         else:
             raise IndexError(f"First map the action named {action_name}!")
 
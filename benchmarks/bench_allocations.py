@@ -0,0 +1,128 @@
+"""
+Steady-state allocations per event of button and joystick paths (EvdevDeviceInput.handle_event -> ActionDispatcher ->
+Mapping.executeAction), after warm-up:
+- retained - memory blocks still allocated after the event (sys.getallocatedblocks), should be 0
+- allocated - bytes allocated during the event, even if freed at its end (tracemalloc peak). Objects reused from
+  CPython free lists (tuples, floats of joystick tilt) aren't allocations, ints above 256 are. Button path still
+  allocates new values of the pressed keys bitmask and both paths allocate dispatcher counters once they pass 256,
+  so allocated isn't 0.
+Run from repository root: python benchmarks/bench_allocations.py
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EvdevInput import EvdevDeviceInput  # noqa: E402
+from EvdevRecording import ReplayDevice  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+
+
+def build_input():
+    mp = MappingClass()
+    pi = EvdevDeviceInput(mp)
+    mp.map_standard_action("press", lambda: None)
+    mp.map_standard_action("release", lambda: None)
+    mp.map_standard_action("drive", lambda x, y: None)
+    pi.bind_EV_KEY("press", "BTN_SOUTH", 1)
+    pi.bind_EV_KEY("release", "BTN_SOUTH", 0)
+    pi.bind_double_EV_ABS("drive", "ABS_X", "ABS_Y")
+    device = ReplayDevice("/bench/pad", "bench pad", "", [ev.ecodes.BTN_SOUTH],
+                          {ev.ecodes.ABS_X: ev.AbsInfo(0, -32768, 32767, 16, 128, 0),
+                           ev.ecodes.ABS_Y: ev.AbsInfo(0, -32768, 32767, 16, 128, 0)})
+    pi.calibrate_device(device)
+    return mp, pi, device
+
+
+def button_events(count):
+    return [ev.InputEvent(0, 0, ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, i % 2 == 0) for i in range(count)]
+
+
+def joystick_events(count):
+    return [ev.InputEvent(0, 0, ev.ecodes.EV_ABS, ev.ecodes.ABS_X if i % 2 else ev.ecodes.ABS_Y,
+                          (i * 997) % 65536 - 32768) for i in range(count)]
+
+
+def run(mp, pi, device, events, batch=16):
+    handle_event = pi.handle_event
+    run_pending = mp.dispatcher.run_pending
+    for i in range(0, len(events), batch):
+        for event in events[i:i + batch]:
+            handle_event(device, event)
+        run_pending()
+
+
+def retained_blocks(events, step):
+    """
+    :return: memory blocks still allocated after every step(event) (sys.getallocatedblocks), events retaining any
+    """
+    allocated_blocks = sys.getallocatedblocks
+    retained = 0
+    retaining_events = 0
+    for event in events:
+        blocks = allocated_blocks()
+        step(event)
+        blocks = allocated_blocks() - blocks
+        retained += blocks
+        retaining_events += blocks > 0
+    return retained, retaining_events
+
+
+def allocated_bytes(events, step):
+    """
+    :return: bytes allocated during every step(event), even if freed at its end (tracemalloc peak), events allocating
+    any
+    """
+    get_traced_memory = tracemalloc.get_traced_memory
+    reset_peak = tracemalloc.reset_peak
+    tracemalloc.start()
+    allocated = 0
+    allocating_events = 0
+    for event in events:
+        current = get_traced_memory()[0]
+        reset_peak()
+        step(event)
+        size = get_traced_memory()[1] - current
+        allocated += size
+        allocating_events += size > 0
+    tracemalloc.stop()
+    return allocated, allocating_events
+
+
+def measure(name, events):
+    mp, pi, device = build_input()
+    handle_event = pi.handle_event
+    run_pending = mp.dispatcher.run_pending
+
+    def step(event):
+        handle_event(device, event)
+        run_pending()
+
+    def empty_step(event):
+        pass
+
+    # warm-up fills pools, dict tables and free lists
+    run(mp, pi, device, events)
+    gc.collect()
+
+    # measuring itself allocates (e.g. ints it gets), it's subtracted
+    retained, retaining_events = retained_blocks(events, step)
+    retained -= retained_blocks(events, empty_step)[0]
+    allocated, allocating_events = allocated_bytes(events, step)
+    allocated -= allocated_bytes(events, empty_step)[0]
+
+    print(f"{name:9s} {len(events)} events: retained {retained / len(events):+.4f} blocks/event, "
+          f"allocated {allocated / len(events):6.2f} B/event ({allocating_events} events allocated any)")
+
+
+def main(count: int = 100000):
+    measure("button", button_events(count))
+    measure("joystick", joystick_events(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Per-event cost of EvdevDeviceInput.handle_event for growing number of bindings.
+Run from repository root: python benchmarks/bench_binding_index.py
+"""
+import os
+import sys
+from timeit import timeit
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EvdevInput import EvdevDeviceInput  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+
+
+class CountingInput(EvdevDeviceInput):
+    """
+    Only count pushed actions, so benchmark measures event resolution and not the queue
+    """
+    def __init__(self, related_mapping):
+        super().__init__(related_mapping)
+        self.pushed = 0
+
+    def push_button_on_queue(self, action_name, event_time=None):
+        self.pushed += 1
+
+
+def build_input(binds_count: int) -> CountingInput:
+    mp = MappingClass()
+    pi = CountingInput(mp)
+    key_names = [name if isinstance(name, str) else name[0] for code, name in sorted(ev.ecodes.keys.items())]
+    for i, key_name in enumerate(key_names[:binds_count]):
+        mp.map_standard_action(f"action_{i}", lambda: None)
+        pi.bind_EV_KEY(f"action_{i}", key_name, 1)
+    return pi
+
+
+def main(events: int = 200000):
+    for binds_count in (5, 50, 500):
+        pi = build_input(binds_count)
+        last_code = ev.ecodes.ecodes[pi.button_binds[f"action_{binds_count - 1}"][0][0]]
+        press = ev.InputEvent(0, 0, ev.ecodes.EV_KEY, last_code, 1)
+        unbound = ev.InputEvent(0, 0, ev.ecodes.EV_KEY, last_code, 3)
+        for name, event in (("bound", press), ("unbound", unbound)):
+            seconds = timeit(lambda: pi.handle_event(None, event), number=events)
+            print(f"{binds_count:4d} binds, {name:8s} event: {seconds / events * 1e9:8.1f} ns/event")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Latency of e-stop submitted while drive commands flood the dispatcher, with and without preempting priority.
+Drive commands are submitted by "evdev" source faster than worker executes them, e-stop by "voice" source.
+
+Run from repository root: python benchmarks/bench_bus.py
+"""
+import os
+import sys
+import threading
+from time import monotonic, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MappingClass import MappingClass  # noqa: E402
+
+DRIVE_EXECUTION = 0.0005
+
+
+def measure(preempt: bool, stops: int = 50, drives_per_stop: int = 100, capacity=None):
+    mp = MappingClass(capacity=capacity)
+    stopped = threading.Event()
+    mp.map_standard_action("drive", lambda x, y: sleep(DRIVE_EXECUTION))
+    mp.map_standard_action("estop", stopped.set)
+    if preempt:
+        mp.dispatcher.set_priority("estop", 100, preempt=True)
+    mp.dispatcher.start(1)
+
+    latencies = []
+    lost = 0
+    try:
+        for _ in range(stops):
+            for i in range(drives_per_stop):
+                mp.dispatcher.submit_axes("drive", i, -i, source="evdev")
+            stopped.clear()
+            start = monotonic()
+            if not mp.dispatcher.submit("estop", source="voice"):
+                # full dispatcher rejected it
+                lost += 1
+            elif not stopped.wait(10):
+                raise RuntimeError("e-stop wasn't executed")
+            else:
+                latencies.append(monotonic() - start)
+            # let the rest of drive commands drain
+            while mp.dispatcher.pending_count():
+                sleep(0.001)
+    finally:
+        mp.dispatcher.stop()
+    return sorted(latencies), lost, mp.dispatcher
+
+
+def main():
+    for name, preempt, capacity in (("fifo", False, None), ("bounded fifo", False, 32),
+                                    ("preempting e-stop", True, None)):
+        latencies, lost, dispatcher = measure(preempt, capacity=capacity)
+        stats = dispatcher.stats()
+        if latencies:
+            latency = f"p50 {latencies[len(latencies) // 2] * 1e3:7.2f}  max {latencies[-1] * 1e3:7.2f}"
+        else:
+            latency = f"p50 {'-':>7s}  max {'-':>7s}"
+        print(f"{name:18s} e-stop latency [ms] {latency}  lost {lost:3d}   "
+              f"drives executed {dispatcher.source_stats()['evdev']['executed']:5d}  "
+              f"preempted {stats['preempted']:5d}  rejected {stats['rejected']:5d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-event cost of EvdevDeviceInput.handle_event with growing number of chord, double-tap and long press bindings.
+Run from repository root: python benchmarks/bench_combos.py
+"""
+import os
+import sys
+from timeit import timeit
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_binding_index import CountingInput  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+
+KEY_NAMES = [name if isinstance(name, str) else name[0] for code, name in sorted(ev.ecodes.keys.items())]
+
+
+def build_input(combos_count: int) -> CountingInput:
+    """
+    combos_count chords of 3 keys, combos_count / 4 double-taps and long presses, over first 64 keys
+    """
+    mp = MappingClass()
+    pi = CountingInput(mp)
+    keys = KEY_NAMES[:64]
+    for i in range(combos_count):
+        mp.map_standard_action(f"chord_{i}", lambda: None)
+        pi.bind_chord(f"chord_{i}", [keys[i % 64], keys[(i * 7 + 1) % 64], keys[(i * 13 + 2) % 64]])
+    for i in range(combos_count // 4):
+        mp.map_standard_action(f"tap_{i}", lambda: None)
+        mp.map_standard_action(f"long_{i}", lambda: None)
+        pi.bind_double_tap(f"tap_{i}", keys[i % 64])
+        pi.bind_long_press(f"long_{i}", keys[(i + 32) % 64])
+    return pi
+
+
+def main(events: int = 100000):
+    for combos_count in (0, 100, 400):
+        pi = build_input(combos_count)
+        frames = {
+            # press and release of a key used by chords, double-taps and long presses
+            "combo key": [ev.ecodes.ecodes[KEY_NAMES[0]]],
+            # key no combo uses
+            "other key": [ev.ecodes.ecodes[KEY_NAMES[100]]],
+            # three keys pressed together
+            "chord": [ev.ecodes.ecodes[KEY_NAMES[i]] for i in (0, 1, 2)],
+        }
+        for name, codes in frames.items():
+            presses = [ev.InputEvent(0, 0, ev.ecodes.EV_KEY, code, 1) for code in codes]
+            releases = [ev.InputEvent(0, 0, ev.ecodes.EV_KEY, code, 0) for code in codes]
+
+            def run():
+                for event in presses:
+                    pi.handle_event(None, event)
+                for event in releases:
+                    pi.handle_event(None, event)
+                # like listener loop does after every read
+                pi.next_repeat_deadline()
+
+            seconds = timeit(run, number=events)
+            print(f"{combos_count:4d} chords, {name:9s}: {seconds / events / (2 * len(codes)) * 1e9:8.1f} ns/event, "
+                  f"{pi.pushed / events:5.2f} actions/frame")
+            pi.pushed = 0
+
+
+if __name__ == '__main__':
+    main()
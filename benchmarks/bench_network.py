@@ -0,0 +1,125 @@
+"""
+End-to-end latency and jitter of the network input bridge over loopback: events are written to a pipe device read by
+NetworkSender, received by NetworkDeviceManager and handled by EvdevDeviceInput, latency is measured until the bound
+action starts. The last row relays UDP packets through a link that drops and reorders some of them.
+
+Run from repository root: python benchmarks/bench_network.py
+"""
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+from time import monotonic, sleep
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import PipeDevice, frame, percentiles  # noqa: E402
+from DeviceManager import DeviceManager  # noqa: E402
+from EvdevInput import EvdevDeviceInput  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+from NetworkBridge import NetworkDeviceManager, NetworkSender  # noqa: E402
+
+# packets are signed, as they should be outside of loopback
+KEY = b"bench"
+
+
+def lossy_proxy(target, loss: float, reorder: float):
+    """
+    UDP relay dropping loss and swapping reorder part of packets
+    :return: address of the relay
+    """
+    relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    relay.bind(("127.0.0.1", 0))
+    generator = random.Random(1)
+
+    def run():
+        held = None
+        while True:
+            data = relay.recv(65535)
+            chance = generator.random()
+            if chance < loss:
+                continue
+            if chance < loss + reorder and held is None:
+                held = data
+                continue
+            relay.sendto(data, target)
+            if held is not None:
+                relay.sendto(held, target)
+                held = None
+
+    threading.Thread(target=run, args=(), daemon=True).start()
+    return relay.getsockname()
+
+
+def measure(protocol: str, samples: int, loss: float = 0.0, reorder: float = 0.0):
+    receiver = NetworkDeviceManager("127.0.0.1", 0, protocol, key=KEY)
+    receiver.start()
+    mp = MappingClass(workers=1)
+    pi = EvdevDeviceInput(mp, device_manager=receiver)
+    pi.source = "network"
+    executed = threading.Event()
+    stamp = [0.0]
+
+    def action():
+        stamp[0] = monotonic()
+        executed.set()
+
+    mp.map_standard_action("measured", action)
+    pi.bind_EV_KEY("measured", "BTN_SOUTH", 1)
+    threading.Thread(target=pi.listen_and_push, args=(), daemon=True).start()
+
+    device = PipeDevice("/bench/network")
+    device_dir = tempfile.mkdtemp()
+    open(os.path.join(device_dir, "event0"), 'w').close()
+    address = receiver.address
+    if loss or reorder:
+        address = lossy_proxy(address, loss, reorder)
+    sender = NetworkSender(*address, protocol=protocol, describe_interval=0.1, key=KEY,
+                           device_manager=DeviceManager(device_dir, opener=lambda path: device))
+    threading.Thread(target=sender.run, args=(), daemon=True).start()
+    end = monotonic() + 5
+    while not receiver.devices:
+        if monotonic() > end:
+            raise RuntimeError("Remote device wasn't attached")
+        sleep(0.01)
+
+    results = []
+    lost = 0
+    try:
+        for _ in range(samples):
+            executed.clear()
+            start = monotonic()
+            device.write(frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 1)) +
+                         frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 0)))
+            # lost press is never executed, next state packet has key released already
+            if executed.wait(0.5):
+                results.append(stamp[0] - start)
+            else:
+                lost += 1
+            sleep(0.001)
+    finally:
+        sender.stop()
+    return results, lost, receiver, sender
+
+
+def main(samples: int = 2000):
+    for protocol, loss, reorder in (("udp", 0.0, 0.0), ("tcp", 0.0, 0.0), ("udp", 0.02, 0.05)):
+        results, lost, receiver, sender = measure(protocol, samples if not loss else samples // 10, loss, reorder)
+        latency = percentiles(results)
+        # mean difference of consecutive samples, like RFC 3550 interarrival jitter
+        jitter = sum(abs(b - a) for a, b in zip(results, results[1:])) / max(1, len(results) - 1) * 1e6
+        stats = receiver.stats()
+        print(f"{protocol} loss {loss:4.0%} reorder {reorder:4.0%}  latency [us] p50 {latency[50]:7.1f}  "
+              f"p90 {latency[90]:7.1f}  p99 {latency[99]:7.1f}  max {latency[100]:8.1f}  jitter {jitter:6.1f}  "
+              f"presses lost {lost:3d}  packets lost {stats['lost']:3d}  late {stats['late']:3d}  "
+              f"recovered {stats['recovered']:3d}  resyncs {stats['resyncs']:3d}  "
+              f"{sender.bytes / max(1, sender.packets):5.1f} bytes/packet")
+
+
+if __name__ == '__main__':
+    main()
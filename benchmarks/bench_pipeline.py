@@ -0,0 +1,222 @@
+"""
+Hardware-free throughput and latency benchmark of EvdevDeviceInput.listen_and_push.
+Events are written in kernel input_event format to a pipe which stands in for /dev/input/event* node, so the whole
+pipeline (selector reader, dispatch tables, repeats, dispatcher, worker thread) is exercised.
+
+Run from repository root:
+python benchmarks/bench_pipeline.py [recording made with EvdevRecording.EventRecorder]
+"""
+import os
+import struct
+import sys
+import tempfile
+import threading
+from time import monotonic, time
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DeviceManager import DeviceManager  # noqa: E402
+from EvdevInput import EvdevDeviceInput  # noqa: E402
+from EvdevRecording import EventReplay, ReplayDevice  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+
+INPUT_EVENT = struct.Struct('llHHi')
+
+KEYS = [ev.ecodes.BTN_SOUTH, ev.ecodes.BTN_EAST, ev.ecodes.BTN_START]
+AXES = {code: ev.AbsInfo(0, -32768, 32767, 16, 128, 0) for code in (ev.ecodes.ABS_X, ev.ecodes.ABS_Y)}
+
+
+class PipeDevice(ReplayDevice):
+    """
+    Device whose events come from a pipe, in the same binary format kernel uses
+    """
+    def __init__(self, path, name="bench pad", phys="", keys=None, axes=None):
+        super().__init__(path, name, phys, KEYS if keys is None else keys, dict(AXES if axes is None else axes))
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+
+    def fileno(self):
+        return self.read_fd
+
+    def read(self):
+        data = os.read(self.read_fd, INPUT_EVENT.size * 256)
+        for sec, usec, type_, code, value in INPUT_EVENT.iter_unpack(data):
+            yield ev.InputEvent(sec, usec, type_, code, value)
+
+    def read_one(self):
+        try:
+            data = os.read(self.read_fd, INPUT_EVENT.size)
+        except BlockingIOError:
+            return None
+        return ev.InputEvent(*INPUT_EVENT.unpack(data))
+
+    def write(self, events):
+        now = time()
+        sec = int(now)
+        usec = int((now - sec) * 1000000)
+        os.write(self.write_fd, b''.join(INPUT_EVENT.pack(sec, usec, type_, code, value)
+                                         for type_, code, value in events))
+
+
+def start_pipeline(device, frame_mode=False):
+    device_dir = tempfile.mkdtemp()
+    open(os.path.join(device_dir, "event0"), 'w').close()
+    mp = MappingClass(workers=1)
+    pi = EvdevDeviceInput(mp, frame_mode=frame_mode,
+                          device_manager=DeviceManager(device_dir, opener=lambda path: device))
+    pi.hold_repeat_interval = 0.01
+    pi.joystick_repeat_interval = 0.01
+    return mp, pi
+
+
+def listen(pi):
+    threading.Thread(target=pi.listen_and_push, args=(), daemon=True).start()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6 for p in (50, 90, 99, 100)}
+
+
+def frame(*events):
+    return list(events) + [(ev.ecodes.EV_SYN, ev.ecodes.SYN_REPORT, 0)]
+
+
+def throughput(device, pi, mp, events, chunk=64):
+    """
+    Write all events, then a sentinel press and wait until its action is executed
+    """
+    done = threading.Event()
+    mp.map_standard_action("bench_done", done.set)
+    pi.bind_EV_KEY("bench_done", "BTN_START", 1)
+    listen(pi)
+
+    start = monotonic()
+    for i in range(0, len(events), chunk):
+        device.write(events[i:i + chunk])
+    device.write(frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_START, 1)))
+    done.wait()
+    return len(events) / (monotonic() - start)
+
+
+def latency(device, samples, event_for, setup=None):
+    """
+    Write single frame and measure time until bound action starts
+    """
+    executed = threading.Event()
+    stamp = [0.0]
+
+    def action(*args, **kwargs):
+        stamp[0] = monotonic()
+        executed.set()
+
+    mp, pi = start_pipeline(device)
+    mp.map_standard_action("measured", action)
+    if setup is not None:
+        setup(mp, pi)
+    listen(pi)
+
+    results = []
+    for i in range(samples):
+        executed.clear()
+        start = monotonic()
+        device.write(event_for(i, pi))
+        executed.wait()
+        results.append(stamp[0] - start)
+    return results
+
+
+def button_workload(samples):
+    device = PipeDevice("/bench/button")
+    mp, pi = start_pipeline(device)
+    mp.map_standard_action("press", lambda: None)
+    mp.map_standard_action("release", lambda: None)
+    pi.bind_EV_KEY("press", "BTN_SOUTH", 1)
+    pi.bind_EV_KEY("release", "BTN_SOUTH", 0)
+    events = []
+    for i in range(samples):
+        events += frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, (i + 1) % 2))
+    rate = throughput(device, pi, mp, events)
+
+    def bind(mp, pi):
+        pi.bind_EV_KEY("measured", "BTN_SOUTH", 1)
+
+    def press(i, pi):
+        return frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 1)) + frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 0))
+
+    return rate, latency(PipeDevice("/bench/button"), min(samples, 2000), press, bind)
+
+
+def hold_workload(samples):
+    device = PipeDevice("/bench/hold")
+    mp, pi = start_pipeline(device)
+    mp.map_standard_action("hold", lambda: None)
+    mp.map_standard_action("press", lambda: None)
+    pi.bind_EV_KEY("hold", "BTN_SOUTH", 2)
+    pi.bind_EV_KEY("press", "BTN_EAST", 1)
+    events = frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 1))
+    for i in range(samples):
+        events += frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_EAST, (i + 1) % 2))
+    rate = throughput(device, pi, mp, events)
+
+    # press latency while another button is held and repeated
+    def bind(mp, pi):
+        mp.map_standard_action("hold", lambda: None)
+        pi.bind_EV_KEY("hold", "BTN_SOUTH", 2)
+        pi.bind_EV_KEY("measured", "BTN_EAST", 1)
+
+    def press(i, pi):
+        events = frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_EAST, 1)) + frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_EAST, 0))
+        if i == 0:
+            events = frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 1)) + events
+        return events
+
+    return rate, latency(PipeDevice("/bench/hold"), min(samples, 2000), press, bind)
+
+
+def joystick_workload(samples):
+    device = PipeDevice("/bench/joystick")
+    mp, pi = start_pipeline(device)
+    mp.map_standard_action("drive", lambda x, y: None)
+    pi.bind_double_EV_ABS("drive", "ABS_X", "ABS_Y")
+    events = []
+    for i in range(samples):
+        events += frame((ev.ecodes.EV_ABS, ev.ecodes.ABS_X, (i * 97) % 65536 - 32768),
+                        (ev.ecodes.EV_ABS, ev.ecodes.ABS_Y, (i * 89) % 65536 - 32768))
+    rate = throughput(device, pi, mp, events)
+
+    def bind(mp, pi):
+        pi.bind_double_EV_ABS("measured", "ABS_X", "ABS_Y")
+        # every sample has to reach the action
+        mp.dispatcher.set_policy("measured", "queued")
+
+    def tilt(i, pi):
+        return frame((ev.ecodes.EV_ABS, ev.ecodes.ABS_X, 32767 if i % 2 else -32768))
+
+    return rate, latency(PipeDevice("/bench/joystick"), min(samples, 2000), tilt, bind)
+
+
+def replay_recording(path):
+    replay = EventReplay(path)
+    device = PipeDevice("/bench/replay", keys=replay.devices[0].keys, axes=replay.devices[0].axes)
+    mp, pi = start_pipeline(device)
+    events = [(type_, code, value) for timestamp, index, type_, code, value in replay.events]
+    return throughput(device, pi, mp, events)
+
+
+def main(samples: int = 20000):
+    if len(sys.argv) > 1:
+        print(f"replay {sys.argv[1]}: {replay_recording(sys.argv[1]):10.0f} events/s")
+        return
+
+    for name, workload in (("button", button_workload), ("hold", hold_workload), ("joystick", joystick_workload)):
+        rate, latencies = workload(samples)
+        p = percentiles(latencies)
+        print(f"{name:9s} {rate:10.0f} events/s   event->action latency [us] "
+              f"p50 {p[50]:7.1f}  p90 {p[90]:7.1f}  p99 {p[99]:7.1f}  max {p[100]:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
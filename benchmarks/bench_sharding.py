@@ -0,0 +1,98 @@
+"""
+E-stop button latency while another device floods abs events - single select loop vs sharded reader
+(watcher thread per device, e-stop pad with higher priority).
+Watcher threads share the GIL, so sharded latency may depend on interpreter switch interval - both readers are
+measured with the default one and with sys.setswitchinterval(0.0005).
+Run from repository root: python benchmarks/bench_sharding.py
+"""
+import os
+import signal
+import sys
+import tempfile
+import threading
+from time import monotonic, sleep
+
+import evdev as ev
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import PipeDevice, frame, percentiles  # noqa: E402
+from DeviceManager import DeviceManager  # noqa: E402
+from EvdevInput import EvdevDeviceInput  # noqa: E402
+from MappingClass import MappingClass  # noqa: E402
+
+
+def measure(reader, samples=500):
+    device_dir = tempfile.mkdtemp()
+    devices = {}
+    for name in ("event0", "event1"):
+        path = os.path.join(device_dir, name)
+        open(path, 'w').close()
+        devices[path] = PipeDevice(path, name="flood" if name == "event0" else "estop")
+    flood, estop = devices.values()
+
+    # flood is written by another process, like kernel would do - it doesn't compete for GIL
+    # forked before any thread is started
+    writer = os.fork()
+    if writer == 0:
+        i = 0
+        try:
+            while True:
+                events = []
+                for _ in range(32):
+                    i += 1
+                    events += frame((ev.ecodes.EV_ABS, ev.ecodes.ABS_X, (i * 97) % 65536 - 32768),
+                                    (ev.ecodes.EV_ABS, ev.ecodes.ABS_Y, (i * 89) % 65536 - 32768))
+                flood.write(events)
+        finally:
+            os._exit(0)
+
+    mp = MappingClass(workers=1)
+    pi = EvdevDeviceInput(mp, reader=reader, device_manager=DeviceManager(device_dir, opener=devices.__getitem__))
+    pi.set_device_priority("estop", 10)
+
+    executed = threading.Event()
+    stamp = [0.0]
+
+    def stop():
+        stamp[0] = monotonic()
+        executed.set()
+
+    mp.map_standard_action("stop", stop)
+    mp.map_standard_action("drive", lambda x, y: None)
+    pi.bind_EV_KEY("stop", "BTN_SOUTH", 1)
+    pi.bind_double_EV_ABS("drive", "ABS_X", "ABS_Y")
+    threading.Thread(target=pi.listen_and_push, args=(), daemon=True).start()
+    sleep(0.2)
+
+    results = []
+    try:
+        for _ in range(samples):
+            executed.clear()
+            start = monotonic()
+            estop.write(frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 1)) +
+                        frame((ev.ecodes.EV_KEY, ev.ecodes.BTN_SOUTH, 0)))
+            if not executed.wait(5):
+                raise RuntimeError(f"{reader}: e-stop action wasn't executed")
+            results.append(stamp[0] - start)
+            sleep(0.001)
+    finally:
+        os.kill(writer, signal.SIGKILL)
+        os.waitpid(writer, 0)
+    return results
+
+
+def main():
+    default_interval = sys.getswitchinterval()
+    for interval in (default_interval, 0.0005):
+        sys.setswitchinterval(interval)
+        for reader in ("select", "sharded"):
+            p = percentiles(measure(reader))
+            print(f"{reader:8s} switch {interval * 1000:4.1f}ms  e-stop latency under flood [us] "
+                  f"p50 {p[50]:8.1f}  p90 {p[90]:8.1f}  p99 {p[99]:8.1f}  max {p[100]:8.1f}")
+    sys.setswitchinterval(default_interval)
+
+
+if __name__ == '__main__':
+    main()
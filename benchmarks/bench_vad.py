@@ -0,0 +1,94 @@
+"""
+Offline run of VoiceActivityDetector over a WAV file - forwarded segments, duty cycle and processing speed.
+Without argument, synthetic fixtures are generated:
+- background noise, two voiced segments (1.0-1.8 s, 3.0-4.2 s) and a loud hiss burst (5.0-5.5 s) which shouldn't be
+  forwarded
+- near silence, then steady 120 Hz hum from 2 s (e.g. motors started) with a voiced command at 12.0-12.8 s - the hum
+  may open a segment, but it has to end within the noise window, the command has to be forwarded
+Run from repository root: python benchmarks/bench_vad.py [16 bit mono WAV]
+"""
+import os
+import sys
+import tempfile
+import wave
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VoiceActivity import VoiceActivityDetector, detect_wav  # noqa: E402
+
+
+def add_voice(signal, t, start: float, end: float) -> None:
+    voiced = (t >= start) & (t < end)
+    # 220 Hz "voice" with syllable-like envelope
+    signal[voiced] += 6000 * np.sin(2 * np.pi * 220 * t[voiced]) * np.sin(2 * np.pi * 3 * t[voiced]) ** 2
+
+
+def synthetic_fixture(path: str, rate: int = 16000, seconds: int = 6) -> None:
+    rng = np.random.default_rng(1)
+    t = np.arange(rate * seconds) / rate
+    signal = rng.normal(0, 300, len(t))
+    for start, end in ((1.0, 1.8), (3.0, 4.2)):
+        add_voice(signal, t, start, end)
+    hiss = (t >= 5.0) & (t < 5.5)
+    signal[hiss] += rng.normal(0, 5000, np.count_nonzero(hiss))
+    write_wav(path, signal, rate)
+
+
+def hum_fixture(path: str, rate: int = 16000, seconds: int = 22) -> None:
+    rng = np.random.default_rng(2)
+    t = np.arange(rate * seconds) / rate
+    signal = rng.normal(0, 20, len(t))
+    hum = t >= 2.0
+    signal[hum] += 2500 * np.sin(2 * np.pi * 120 * t[hum])
+    add_voice(signal, t, 12.0, 12.8)
+    write_wav(path, signal, rate)
+
+
+def write_wav(path: str, signal, rate: int) -> None:
+    with wave.open(path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(np.clip(signal, -32768, 32767).astype(np.int16).tobytes())
+
+
+def run(path: str):
+    with wave.open(path, 'rb') as file:
+        duration = file.getnframes() / file.getframerate()
+
+    start = perf_counter()
+    segments, detector = detect_wav(path)
+    elapsed = perf_counter() - start
+    for begin, end in segments:
+        print(f"speech {begin:6.2f} - {end:6.2f} s")
+    print(f"duty cycle {detector.duty_cycle:.2f}, {duration / elapsed:.0f}x realtime")
+    return segments
+
+
+def main():
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+        return
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "fixture.wav")
+    synthetic_fixture(path)
+    print("noise, speech and hiss:")
+    run(path)
+
+    path = os.path.join(directory, "hum.wav")
+    hum_fixture(path)
+    print("hum after silence:")
+    segments = run(path)
+    # hum segment may last noise window, pre-roll (0.2 s) and hangover (0.3 s) of default detector, one frame margin
+    limit = VoiceActivityDetector().noise_window_ms / 1000 + 0.52
+    if any(end - begin > limit for begin, end in segments):
+        raise RuntimeError("steady hum kept the detector in speech")
+    if not any(begin <= 12.0 and end >= 12.8 for begin, end in segments):
+        raise RuntimeError("command over hum wasn't forwarded")
+
+
+if __name__ == '__main__':
+    main()